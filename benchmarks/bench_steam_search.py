@@ -0,0 +1,72 @@
+"""Сравнение способов разбора страницы поиска Steam
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_steam_search [fixture.html ...]
+"""
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from parsers.steam import SteamParser
+
+FIXTURES = Path(__file__).parent / "fixtures"
+ROUNDS = 50
+
+
+def parse_full_tree(html: str) -> list:
+    """Исходный вариант: полное дерево html.parser и CSS-селекторы"""
+    soup = BeautifulSoup(html, 'html.parser')
+    items = []
+    for row in soup.select('a.search_result_row'):
+        app_id = row.get('data-ds-appid')
+        title_elem = row.select_one('span.title')
+        if not app_id or not title_elem:
+            continue
+        items.append({
+            'id': int(app_id),
+            'name': title_elem.text.strip(),
+            'url': row.get('href')
+        })
+    return items
+
+
+PARSERS = {
+    "full tree": parse_full_tree,
+    "SoupStrainer": SteamParser.parse_search_results_soup,
+    "regex rows": SteamParser.parse_search_results,
+}
+
+
+def measure(parse, html: str):
+    """Возвращает (среднее время разбора в мс, пиковую память в КБ)"""
+    parse(html)
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        parse(html)
+    elapsed = (time.perf_counter() - started) / ROUNDS * 1000
+
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024
+
+
+def main(paths):
+    for path in paths:
+        html = Path(path).read_text(encoding='utf-8')
+        expected = parse_full_tree(html)
+        print(f"{Path(path).name}: {len(html) // 1024} КБ, {len(expected)} строк")
+        for name, parse in PARSERS.items():
+            if parse(html) != expected:
+                print(f"  {name}: результат отличается от полного дерева")
+                continue
+            elapsed, peak = measure(parse, html)
+            print(f"  {name:<14} {elapsed:8.2f} мс  {peak:10.0f} КБ пик")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(FIXTURES.glob("*.html")))
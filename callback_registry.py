@@ -0,0 +1,42 @@
+import secrets
+from typing import Optional
+
+from cache import TTLCache
+
+# Токен из 8 случайных байт - 11 символов, callback_data укладывается в 64 байта
+TOKEN_BYTES = 8
+
+
+class CallbackRegistry:
+    """Сопоставляет коротким токенам в callback_data готовые к публикации посты
+
+    В кнопку предпросмотра попадает только токен, а сама игра и подпись
+    хранятся на стороне бота. Устаревшие токены вытесняются по времени жизни.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 24 * 3600):
+        self._payloads = TTLCache(maxsize, ttl)
+
+    def register(self, game_info: dict, caption: str) -> str:
+        """Запоминает пост и возвращает токен для callback_data"""
+        token = secrets.token_urlsafe(TOKEN_BYTES)
+        self._payloads.set(token, {'game_info': game_info, 'caption': caption})
+        return token
+
+    def get(self, token: str) -> Optional[dict]:
+        """Пост по токену или None, если токен неизвестен или устарел"""
+        return self._payloads.get(token)
+
+    def pop(self, token: str) -> Optional[dict]:
+        """Забирает пост по токену: повторное нажатие кнопки его уже не найдет"""
+        return self._payloads.pop(token)
+
+    def restore(self, token: str, payload: dict):
+        """Возвращает забранный пост, если публикация не удалась"""
+        self._payloads.set(token, payload)
+
+    def discard(self, token: str):
+        self._payloads.pop(token)
+
+    def __len__(self) -> int:
+        return len(self._payloads)
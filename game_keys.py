@@ -0,0 +1,49 @@
+import re
+import unicodedata
+
+_APOSTROPHES = re.compile(r"['’`]")
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_title(title: str) -> str:
+    """Приводит название к виду, не зависящему от регистра, пунктуации и пробелов"""
+    title = unicodedata.normalize('NFKC', title or '').casefold()
+    title = _APOSTROPHES.sub('', title)
+    return _NON_WORD.sub(' ', title).strip()
+
+
+def epic_game_key(namespace: str, offer_id: str) -> str:
+    """Ключ игры Epic Games по namespace и id предложения"""
+    return f"epic:{namespace}:{offer_id}"
+
+
+def steam_game_key(app_id) -> str:
+    """Ключ игры Steam по app id"""
+    return f"steam:{app_id}"
+
+
+def title_game_key(title: str) -> str:
+    """Запасной ключ по нормализованному названию (для старых записей истории)"""
+    return f"title:{normalize_title(title)}"
+
+
+def game_key(game_info: dict) -> str:
+    """Возвращает канонический ключ игры"""
+    if game_info.get('key'):
+        return game_info['key']
+    if game_info.get('steam_appid'):
+        return steam_game_key(game_info['steam_appid'])
+    return title_game_key(game_info.get('title'))
+
+
+def index_by_key(games: list) -> dict:
+    """Строит словарь игр по ключу для поиска за O(1)
+
+    Запасные ключи по названию тоже попадают в индекс, чтобы находились
+    записи истории, сохраненные до появления ключей.
+    """
+    index = {}
+    for game in games or []:
+        index.setdefault(title_game_key(game.get('title')), game)
+        index[game_key(game)] = game
+    return index
@@ -0,0 +1,311 @@
+import asyncio
+import configparser
+import copy
+import json
+import math
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+config = configparser.ConfigParser()
+config.read("settings.cfg", encoding="utf-8")
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+# Ответы, после которых запрос стоит повторить
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class ClientConfig:
+    """Общие настройки синхронного и асинхронного клиентов"""
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 15, total_timeout: float = 30,
+                 retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 10,
+                 pool_per_host: int = 4, breaker_threshold: int = 5, breaker_reset: float = 60):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_per_host = pool_per_host
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING}
+
+    def replace(self, **changes) -> 'ClientConfig':
+        """Копия настроек с другими значениями отдельных полей"""
+        config = copy.copy(self)
+        for name, value in changes.items():
+            if not hasattr(config, name):
+                raise AttributeError(name)
+            setattr(config, name, value)
+        return config
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Пауза перед повтором: Retry-After сервера или экспонента со случайным разбросом"""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_base * 2 ** attempt, self.backoff_max))
+
+
+DEFAULT_CONFIG = ClientConfig(
+    connect_timeout=config.getfloat("http", "connect_timeout", fallback=5),
+    read_timeout=config.getfloat("http", "read_timeout", fallback=15),
+    total_timeout=config.getfloat("http", "total_timeout", fallback=30),
+    retries=config.getint("http", "retries", fallback=3),
+    backoff_base=config.getfloat("http", "backoff_base", fallback=0.5),
+    backoff_max=config.getfloat("http", "backoff_max", fallback=10),
+    pool_per_host=config.getint("http", "pool_per_host", fallback=4),
+    breaker_threshold=config.getint("http", "breaker_threshold", fallback=5),
+    breaker_reset=config.getfloat("http", "breaker_reset", fallback=60),
+)
+
+
+class HttpClientError(Exception):
+    """Запрос не удался: сеть, ответ с ошибкой или выключенный хост"""
+
+
+class HttpStatusError(HttpClientError):
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP {status} для {url}")
+        self.status = status
+        self.url = url
+
+
+class CircuitOpenError(HttpClientError):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Хост {host} временно отключен, повтор через {math.ceil(retry_in)} с")
+        self.host = host
+
+
+class CircuitBreaker:
+    """Предохранитель хоста: после threshold запросов подряд, не удавшихся и после повторов,
+    запросы к нему не отправляются reset_timeout секунд, затем
+    пропускается один пробный запрос
+    """
+
+    def __init__(self, host: str, threshold: int, reset_timeout: float):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Бросает CircuitOpenError, если хост отключен"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(self.host, self.reset_timeout - elapsed)
+            # Полуоткрытое состояние: пропускаем пробный запрос, остальные ждут его результата
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"Хост {self.host} отключен на {int(self.reset_timeout)} с после {self.failures} ошибок")
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url: str, config: ClientConfig = DEFAULT_CONFIG) -> CircuitBreaker:
+    """Предохранитель хоста; один на хост для всех клиентов"""
+    host = urlsplit(url).netloc
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host, config.breaker_threshold, config.breaker_reset)
+        return breaker
+
+
+class HttpResponse:
+    """Прочитанный ответ: статус, заголовки и тело"""
+
+    def __init__(self, status: int, headers, body: bytes, url: str, encoding: Optional[str] = None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+        self.encoding = encoding or 'utf-8'
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding, errors='replace')
+
+    def json(self):
+        return json.loads(self.body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise HttpStatusError(self.status, self.url)
+
+
+class HttpClient:
+    """Синхронный клиент поверх requests.Session
+
+    Соединения с каждым хостом переиспользуются (keep-alive), ответы
+    сжимаются, у запросов есть таймауты на соединение и чтение. Ответы
+    429/5xx и сетевые ошибки повторяются с паузой, а хост, который
+    отвечает ошибками подряд, на время отключается предохранителем.
+    """
+
+    def __init__(self, config: ClientConfig = DEFAULT_CONFIG, headers: Optional[Dict[str, str]] = None):
+        self.config = config
+        self.headers = dict(config.headers, **(headers or {}))
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.config.pool_per_host)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update(self.headers)
+                self._session = session
+            return self._session
+
+    def get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+        """GET с повторами; ответы с ошибкой возвращаются как есть, проверять их - raise_for_status()"""
+        breaker = get_breaker(url, self.config)
+        timeout = (self.config.connect_timeout, self.config.read_timeout)
+        # Один раз на вызов: пробный запрос полуоткрытого предохранителя - это весь вызов с повторами
+        breaker.check()
+        for attempt in range(self.config.retries + 1):
+            last_try = attempt == self.config.retries
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+            except requests.RequestException as e:
+                if last_try:
+                    breaker.record_failure()
+                    raise HttpClientError(f"Ошибка запроса к {url}: {e}") from e
+                time.sleep(self.config.backoff(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES:
+                if not last_try:
+                    time.sleep(self.config.backoff(attempt, response.headers.get('Retry-After')))
+                    continue
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return HttpResponse(response.status_code, response.headers, response.content,
+                                response.url, response.encoding)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class AsyncHttpClient:
+    """Асинхронный клиент поверх aiohttp с теми же настройками и предохранителями, что у HttpClient
+
+    Сессия создается при первом запросе и привязана к его event loop.
+    Коду с другим event loop (например, обертке на asyncio.run) нужен свой
+    клиент: чужую сессию нельзя ни использовать, ни закрыть.
+    """
+
+    def __init__(self, config: ClientConfig = DEFAULT_CONFIG, headers: Optional[Dict[str, str]] = None):
+        self.config = config
+        self.headers = dict(config.headers, **(headers or {}))
+        self._session = None
+        self._loop = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is not loop:
+            raise RuntimeError("AsyncHttpClient используется из другого event loop")
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.config.pool_per_host, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(
+                    total=self.config.total_timeout,
+                    connect=self.config.connect_timeout,
+                    sock_read=self.config.read_timeout
+                )
+            )
+            self._loop = loop
+        return self._session
+
+    async def get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict[str, str]] = None,
+                  limiter=None) -> HttpResponse:
+        """GET с повторами; limiter (TokenBucket) расходуется на каждую попытку"""
+        breaker = get_breaker(url, self.config)
+        breaker.check()
+        for attempt in range(self.config.retries + 1):
+            if limiter is not None:
+                await limiter.acquire()
+            last_try = attempt == self.config.retries
+            try:
+                async with self.session.get(url, params=params, headers=headers) as response:
+                    body = await response.read()
+                    result = HttpResponse(response.status, response.headers, body,
+                                          str(response.url), response.charset)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last_try:
+                    breaker.record_failure()
+                    raise HttpClientError(f"Ошибка запроса к {url}: {e!r}") from e
+                await asyncio.sleep(self.config.backoff(attempt))
+                continue
+            if result.status in RETRY_STATUSES:
+                if not last_try:
+                    await asyncio.sleep(self.config.backoff(attempt, result.headers.get('Retry-After')))
+                    continue
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return result
+
+    async def get_json(self, url: str, params: Optional[Dict] = None, limiter=None):
+        response = await self.get(url, params=params, limiter=limiter)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_text(self, url: str, params: Optional[Dict] = None, limiter=None) -> str:
+        response = await self.get(url, params=params, limiter=limiter)
+        response.raise_for_status()
+        return response.text
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            if self._loop is not asyncio.get_running_loop():
+                raise RuntimeError("AsyncHttpClient закрывается из другого event loop")
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+# Клиенты по умолчанию, общие для всех парсеров
+http_client = HttpClient()
+async_http_client = AsyncHttpClient()
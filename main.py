@@ -2,27 +2,45 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
 from aiogram.utils.markdown import hbold, hitalic, hlink
 from generate_post import generate_posts
-from parsers.epicgames import get_free_games
+from parsers.epicgames import FreeGamesSnapshot
+from parsers.steam import DEFAULT_CC
+from game_keys import game_key, steam_game_key
+from callback_registry import CallbackRegistry
+from send_queue import SendQueue, MEDIA_GROUP_SIZE, PRIORITY_CHANNEL, PRIORITY_PREVIEW
+from photo_cache import PhotoCache
+from scheduler import DeadlineScheduler
+from poller import AdaptivePoller
+from supervisor import KeyedLocks, SupervisedTask, Supervisor
+from pipeline import Pipeline, Stage
+from http_client import async_http_client, http_client
 import os
 from datetime import datetime
 import pytz
+import time
 from dotenv import load_dotenv
 from post_history import (
     add_to_history,
     is_game_posted,
     get_posted_games,
+    get_history_entry,
     remove_from_history,
+    update_history,
+    post_fingerprint,
+    history_batch,
+    compact_history,
 )
 from steam_handler import (
     search_steam_games,
     get_steam_game_by_url,
-    create_steam_search_keyboard,
     format_steam_post,
     steam_parser,
+    SearchSession,
+    SearchSessions,
 )
 import configparser
 from pathlib import Path
@@ -35,7 +53,55 @@ config.read("settings.cfg", encoding="utf-8")
 
 TIMEZONE = config.get("timezone", "timezone", fallback="Europe/Moscow")
 CHECK_INTERVAL = config.getint("check_interval", "interval", fallback=3600)
-STEAM_MIN_DISCOUNT = config.getint("steam", "min_discount", fallback=50)
+STEAM_MIN_DISCOUNT = config.getint("steam", "min_discount", fallback=100)
+STEAM_ENRICH_CONCURRENCY = config.getint("steam", "enrich_concurrency", fallback=8)
+PIPELINE_QUEUE_SIZE = config.getint("pipeline", "queue_size", fallback=100)
+STEAM_SCAN_PAGE_SIZE = config.getint("steam", "scan_page_size", fallback=50)
+STEAM_SCAN_CONCURRENCY = config.getint("steam", "scan_concurrency", fallback=4)
+STEAM_SCAN_MAX_PAGES = config.getint("steam", "scan_max_pages", fallback=200)
+STEAM_SCAN_STOP_AFTER = config.getint("steam", "scan_stop_after", fallback=5)
+STEAM_CATALOG_REFRESH = config.getint("steam", "catalog_refresh", fallback=86400)
+EPIC_REGIONS = [
+    region.strip().upper()
+    for region in config.get("epic", "regions", fallback="US,RU").split(",")
+    if region.strip()
+]
+EPIC_SNAPSHOT_TTL = config.getint("epic", "snapshot_ttl", fallback=300)
+EPIC_START_RETRY = config.getint("epic", "start_retry", fallback=60)
+EPIC_START_RETRY_WINDOW = config.getint("epic", "start_retry_window", fallback=3600)
+
+
+def create_poller(name: str, section: str, **defaults) -> AdaptivePoller:
+    """Создает AdaptivePoller с настройками из секции settings.cfg"""
+    return AdaptivePoller(
+        name,
+        min_interval=config.getfloat(section, "min_interval", fallback=defaults["min"]),
+        max_interval=config.getfloat(section, "max_interval", fallback=defaults["max"]),
+        backoff=config.getfloat(section, "backoff", fallback=2.0),
+        window=config.getfloat(section, "window", fallback=defaults["window"]),
+        rollover=config.get(section, "rollover", fallback=defaults.get("rollover")),
+    )
+
+
+epic_poller = create_poller(
+    "epic", "epic_poll", min=120, max=CHECK_INTERVAL, window=1800, rollover="thu 15:00"
+)
+steam_poller = create_poller(
+    "steam",
+    "steam_poll",
+    min=900,
+    max=4 * CHECK_INTERVAL,
+    window=1800,
+    rollover="17:00",
+)
+SEARCH_SESSION_TTL = config.getint("search", "session_ttl", fallback=1800)
+SEARCH_MAX_SESSIONS = config.getint("search", "max_sessions", fallback=100)
+PREVIEW_TTL = config.getint("search", "preview_ttl", fallback=86400)
+TELEGRAM_WORKERS = config.getint("telegram", "workers", fallback=4)
+TELEGRAM_GLOBAL_RATE = config.getfloat("telegram", "global_rate", fallback=30)
+TELEGRAM_PRIVATE_RATE = config.getfloat("telegram", "private_rate", fallback=1)
+TELEGRAM_GROUP_RATE = config.getfloat("telegram", "group_per_minute", fallback=20) / 60
+TELEGRAM_MEDIA_GROUPS = config.getboolean("telegram", "media_groups", fallback=False)
 
 logging.basicConfig(level=logging.INFO)
 
@@ -47,24 +113,58 @@ CHANNEL_ID = os.getenv("TG_CHANNEL_ID")
 if not CHANNEL_ID:
     raise ValueError("Не установлен ID канала (TG_CHANNEL_ID)")
 
+# Необязательный ключ Web API Steam для инкрементального обновления каталога
+STEAM_API_KEY = os.getenv("STEAM_API_KEY")
+
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
+# Все отправки в Telegram идут через очередь с лимитами Bot API
+send_queue = SendQueue(
+    bot,
+    workers=TELEGRAM_WORKERS,
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    private_rate=TELEGRAM_PRIVATE_RATE,
+    group_rate=TELEGRAM_GROUP_RATE,
+    photo_cache=PhotoCache(),
+)
+
+# Снимок раздач для команд и кнопок, живет EPIC_SNAPSHOT_TTL секунд
+interactive_snapshot = FreeGamesSnapshot(EPIC_REGIONS, ttl=EPIC_SNAPSHOT_TTL)
+# Снимок для таймеров начала: одновременные старты делят один запрос,
+# а повтор через EPIC_START_RETRY уже видит свежие данные
+deadline_snapshot = FreeGamesSnapshot(EPIC_REGIONS, ttl=EPIC_START_RETRY / 2)
+
+# Таймеры на начало и конец опубликованных раздач Epic Games
+giveaway_scheduler = DeadlineScheduler()
+# Проверки и таймеры раздач меняют пост и историю одной игры по очереди
+game_locks = KeyedLocks()
+# Игры, чьи посты еще отправляются: после таймаута проверки публикация
+# доходит в фоне, и следующий прогон не должен поставить их снова
+publishing_keys = set()
+
+# Результаты поиска Steam по сообщению с клавиатурой
+search_sessions = SearchSessions(SEARCH_MAX_SESSIONS, SEARCH_SESSION_TTL)
+
+# Посты из предпросмотра по токенам из кнопок "Опубликовать" и "Удалить"
+previews = CallbackRegistry(ttl=PREVIEW_TTL)
+
 
 def get_post_keyboard(
-    post_id: str, game_info: dict = None
+    token: str, game_info: dict = None
 ) -> Optional[InlineKeyboardMarkup]:
     """Создает клавиатуру с кнопками для поста"""
     buttons = []
 
-    if post_id:
+    # Кнопки предпросмотра ссылаются на пост в previews, в канале их нет
+    if token:
         buttons.append(
             [
                 InlineKeyboardButton(
-                    text="✅ Опубликовать", callback_data=f"post_{post_id}"
+                    text="✅ Опубликовать", callback_data=f"post_{token}"
                 ),
                 InlineKeyboardButton(
-                    text="❌ Удалить", callback_data=f"delete_{post_id}"
+                    text="❌ Удалить", callback_data=f"delete_{token}"
                 ),
             ]
         )
@@ -77,6 +177,20 @@ def get_post_keyboard(
     return InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
 
 
+def get_batch_keyboard(games: list, tokens: list) -> InlineKeyboardMarkup:
+    """Клавиатура публикации для альбома предпросмотра: кнопка на каждую игру"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="✅ " + game["title"], callback_data=f"post_{token}"
+                )
+            ]
+            for game, token in zip(games, tokens)
+        ]
+    )
+
+
 def format_game_post(game_info: dict) -> str:
     """Форматирует пост об игре используя HTML разметку"""
     start_date = datetime.fromisoformat(game_info["start_date"].replace("Z", "+00:00"))
@@ -121,29 +235,229 @@ def format_game_post(game_info: dict) -> str:
     return "\n".join(text)
 
 
-async def check_steam_deals():
-    """Проверяет скидки в Steam"""
-    try:
-        search_results = steam_parser.search_games("free")
+async def send_photo_posts(
+    chat_id, posts: list, priority: int = PRIORITY_CHANNEL, on_error=None
+):
+    """Отправляет посты (game_info, подпись, клавиатура) по порядку"""
+    # Генератор пар (game_info, сообщение): пост пишется в историю сразу после отправки.
+    # Кнопки к постам в альбоме Telegram не прикрепляет
+    if TELEGRAM_MEDIA_GROUPS and len(posts) > 1:
+        # Делим поровну, чтобы не осталось альбома из одной картинки
+        count = -(-len(posts) // MEDIA_GROUP_SIZE)
+        size = -(-len(posts) // count)
+        chunks = [posts[i : i + size] for i in range(0, len(posts), size)]
+    else:
+        chunks = [[post] for post in posts]
 
-        for game in search_results:
-            game_info = steam_parser.get_game_by_id(str(game["id"]))
-            if not game_info or is_game_posted(game_info["title"]):
-                continue
-            formatted_text = format_steam_post(game_info)
-            msg = await bot.send_photo(
-                chat_id=CHANNEL_ID,
-                photo=game_info["image_url"],
-                caption=formatted_text,
-                parse_mode=ParseMode.HTML,
-                reply_markup=get_post_keyboard(None, game_info),
-            )
+    for chunk in chunks:
+        try:
+            if len(chunk) == 1:
+                game_info, caption, reply_markup = chunk[0]
+                messages = [
+                    await send_queue.send(
+                        "send_photo",
+                        chat_id=chat_id,
+                        photo=game_info["image_url"],
+                        caption=caption,
+                        parse_mode=ParseMode.HTML,
+                        reply_markup=reply_markup,
+                        priority=priority,
+                    )
+                ]
+            else:
+                messages = await send_queue.send(
+                    "send_media_group",
+                    chat_id=chat_id,
+                    media=[
+                        InputMediaPhoto(
+                            media=game_info["image_url"],
+                            caption=caption,
+                            parse_mode=ParseMode.HTML,
+                        )
+                        for game_info, caption, _ in chunk
+                    ],
+                    priority=priority,
+                )
+        except Exception as e:
+            # С on_error(posts, error) отправка остальных постов продолжается
+            if on_error is None:
+                raise
+            await on_error(chunk, e)
+            continue
+        for (game_info, _, _), msg in zip(chunk, messages):
+            yield game_info, msg
+
+
+async def publish_posts(posts: list) -> list:
+    """Публикует готовые посты в канал и записывает их в историю"""
+    # Отмена проверки по таймауту не прерывает публикацию: отправленный,
+    # но не записанный в историю пост был бы опубликован повторно
+    keys = {game_key(game_info) for game_info, _, _ in posts}
+    publishing_keys.update(keys)
+    return await asyncio.shield(publish_and_record(posts, keys))
+
+
+async def publish_and_record(posts: list, keys: set) -> list:
+    published = []
+    try:
+        async for game_info, msg in send_photo_posts(CHANNEL_ID, posts):
             add_to_history(
                 game_info, "auto", chat_id=msg.chat.id, message_id=msg.message_id
             )
-            await asyncio.sleep(2)
+            schedule_giveaway(game_info)
+            published.append(game_info)
+    finally:
+        publishing_keys.difference_update(keys)
+    return published
+
+
+def is_game_pending(game_info: dict) -> bool:
+    """Игра уже опубликована или ее пост сейчас отправляется"""
+    return game_key(game_info) in publishing_keys or is_game_posted(game_info)
+
+
+def dedupe_stage() -> Stage:
+    """Отсекает уже опубликованные игры и повторы внутри одного прогона"""
+    seen = set()
+
+    async def dedupe(game_info: dict) -> Optional[dict]:
+        key = game_key(game_info)
+        if key in seen or is_game_pending(game_info):
+            return None
+        seen.add(key)
+        return game_info
+
+    return Stage("dedupe", dedupe)
+
+
+def render_stage(format_post) -> Stage:
+    """Готовит пост: игра, подпись и кнопки"""
+
+    async def render(game_info: dict) -> tuple:
+        return game_info, format_post(game_info), get_post_keyboard(None, game_info)
+
+    return Stage("render", render)
+
+
+def publish_stage() -> Stage:
+    """Публикует посты по одному или альбомами в режиме TELEGRAM_MEDIA_GROUPS"""
+    if TELEGRAM_MEDIA_GROUPS:
+        return Stage("publish", publish_posts, batch_size=MEDIA_GROUP_SIZE)
+    return Stage("publish", lambda post: publish_posts([post]))
+
+
+async def run_pipeline(pipeline: Pipeline, source):
+    """Прогоняет источник через конвейер и пишет в лог счетчики стадий"""
+    try:
+        await pipeline.run(source)
+    finally:
+        logging.info("Конвейер " + pipeline.name + ": " + str(pipeline.stats()))
+
+
+async def check_steam_deals() -> Optional[list]:
+    """Проверяет скидки Steam, возвращает app id найденных или None при ошибке"""
+    found = []
+
+    async def fetch():
+        async for app_id, discount, price in steam_parser.scan_specials(
+            STEAM_MIN_DISCOUNT,
+            page_size=STEAM_SCAN_PAGE_SIZE,
+            concurrency=STEAM_SCAN_CONCURRENCY,
+            max_pages=STEAM_SCAN_MAX_PAGES,
+            stop_after=STEAM_SCAN_STOP_AFTER,
+        ):
+            found.append(app_id)
+            # Уже опубликованные игры отсекаем до запросов за подробностями
+            if not is_game_pending({"key": steam_game_key(app_id)}):
+                yield str(app_id)
+
+    pipeline = Pipeline(
+        "steam",
+        [
+            # Подробности запрашиваются параллельно, но публикуются в порядке поиска
+            Stage(
+                "enrich",
+                steam_parser.get_game_by_id,
+                workers=STEAM_ENRICH_CONCURRENCY,
+                ordered=True,
+            ),
+            dedupe_stage(),
+            render_stage(format_steam_post),
+            publish_stage(),
+        ],
+        queue_size=PIPELINE_QUEUE_SIZE,
+    )
+    try:
+        await run_pipeline(pipeline, fetch())
+        return found
     except Exception as e:
         logging.error("Ошибка при проверке Steam: " + str(e))
+        return None
+
+
+async def edit_post(entry: dict, caption: str, reply_markup=None) -> bool:
+    """Правит подпись и кнопки поста; False - пост нужно отправить заново"""
+    chat_id = entry.get("chat_id")
+    message_id = entry.get("message_id")
+    if not chat_id or not message_id:
+        return False
+    try:
+        await send_queue.send(
+            "edit_message_caption",
+            chat_id=chat_id,
+            message_id=message_id,
+            caption=caption,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup,
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return True
+        logging.warning("Не удалось изменить пост " + entry["title"] + ": " + str(e))
+        return False
+    return True
+
+
+async def announce_finished(entry: dict, platform_tag: str):
+    """Помечает пост о раздаче завершенным, историю не трогает"""
+    text = "\n".join(
+        [
+            "🚫 " + hbold("Раздача завершена"),
+            "",
+            "🎮 " + hbold(entry["title"]),
+            "",
+            "#завершено " + platform_tag,
+        ]
+    )
+    # Удаление и новое сообщение - только если исходный пост не править
+    if not await edit_post(entry, text):
+        chat_id = entry.get("chat_id")
+        msg_id = entry.get("message_id")
+        if chat_id and msg_id:
+            try:
+                await send_queue.send(
+                    "delete_message", chat_id=chat_id, message_id=msg_id
+                )
+            except Exception:
+                pass
+        await send_queue.send(
+            "send_message",
+            chat_id=CHANNEL_ID,
+            text=text,
+            parse_mode=ParseMode.HTML,
+        )
+
+
+def forget_giveaway(key: str):
+    """Убирает завершенную раздачу из истории и снимает ее таймеры"""
+    remove_from_history(key)
+    giveaway_scheduler.cancel(key)
+
+
+async def finish_post(entry: dict, platform_tag: str):
+    """Помечает пост о раздаче завершенным и убирает игру из истории"""
+    await announce_finished(entry, platform_tag)
+    forget_giveaway(entry["key"])
 
 
 async def check_ended_giveaways():
@@ -151,105 +465,196 @@ async def check_ended_giveaways():
     try:
         posted_games = get_posted_games()
         current_time = datetime.now(pytz.UTC)
+        # Для завершения раздачи нужна только скидка основного региона
+        steam_prices = await steam_parser.get_prices(
+            [
+                str(game["steam_appid"])
+                for game in posted_games
+                if game.get("steam_appid")
+            ],
+            regions=[DEFAULT_CC],
+        )
 
-        for game in posted_games:
-            try:
-                steam_id = game.get("steam_appid")
-                if steam_id:
-                    info = steam_parser.get_game_by_id(str(steam_id))
-                    if not info or info["price"]["discount"] < 100:
-                        chat_id = game.get("chat_id")
-                        msg_id = game.get("message_id")
-                        if chat_id and msg_id:
-                            try:
-                                await bot.delete_message(
-                                    chat_id=chat_id, message_id=msg_id
-                                )
-                            except Exception:
-                                pass
-                        text = [
-                            "🚫 " + hbold("Раздача завершена"),
-                            "",
-                            "🎮 " + hbold(game["title"]),
-                            "",
-                            "#завершено #steam",
-                        ]
-                        await bot.send_message(
-                            chat_id=CHANNEL_ID,
-                            text="\n".join(text),
-                            parse_mode=ParseMode.HTML,
-                        )
-                        remove_from_history(game["title"])
-                        logging.info(
-                            "Удалена завершенная раздача Steam: " + game["title"]
-                        )
-                    continue
-                end_time = parse_iso_datetime(game.get("end_date", ""))
-                if current_time > end_time:
-                    chat_id = game.get("chat_id")
-                    msg_id = game.get("message_id")
-                    if chat_id and msg_id:
-                        try:
-                            await bot.delete_message(chat_id=chat_id, message_id=msg_id)
-                        except Exception:
-                            pass
-                    text = [
-                        "🚫 " + hbold("Раздача завершена"),
-                        "",
-                        "🎮 " + hbold(game["title"]),
-                        "",
-                        "#завершено #egs",
-                    ]
-                    await bot.send_message(
-                        chat_id=CHANNEL_ID,
-                        text="\n".join(text),
-                        parse_mode=ParseMode.HTML,
-                    )
-                    remove_from_history(game["title"])
-                    logging.info("Удалена завершенная раздача EGS: " + game["title"])
-            except Exception as e:
-                logging.error(
-                    "Ошибка при обработке завершенной раздачи "
-                    + game["title"]
-                    + ": "
-                    + str(e)
+        finished = []
+        flushed = False
+
+        async def finish(key: str, platform_tag: str):
+            async with game_locks.lock(key):
+                # Таймер раздачи мог завершить ее раньше
+                entry = get_history_entry(key)
+                if entry is None or key in finished:
+                    return
+                await announce_finished(entry, platform_tag)
+                if flushed:
+                    # Проверку отменили, пока шла отправка: пачка уже записана
+                    forget_giveaway(key)
+                else:
+                    finished.append(key)
+                logging.info(
+                    "Завершена раздача " + platform_tag + ": " + entry["title"]
                 )
-                continue
+
+        try:
+            for game in posted_games:
+                try:
+                    # В старых записях журнала app id мог остаться числом
+                    steam_id = str(game.get("steam_appid") or "")
+                    if steam_id:
+                        if steam_id not in steam_prices:
+                            # Цена не получена из-за ошибки запроса, проверим позже
+                            continue
+                        price = steam_prices[steam_id]
+                        if not price or price["discount"] < STEAM_MIN_DISCOUNT:
+                            await asyncio.shield(finish(game["key"], "#steam"))
+                        continue
+                    end_time = parse_iso_datetime(game.get("end_date", ""))
+                    if current_time > end_time:
+                        await asyncio.shield(finish(game["key"], "#egs"))
+                except Exception as e:
+                    logging.error(
+                        "Ошибка при обработке завершенной раздачи "
+                        + game["title"]
+                        + ": "
+                        + str(e)
+                    )
+                    continue
+        finally:
+            # Отправки уже позади: пачка истории короткая и без await
+            flushed = True
+            with history_batch():
+                for key in finished:
+                    forget_giveaway(key)
 
     except Exception as e:
         logging.error("Ошибка при проверке завершенных раздач: " + str(e))
 
 
-async def check_started_giveaways():
-    """Проверяет начавшиеся раздачи"""
+async def sync_epic_game(key: str, game_info: dict):
+    """sync_epic_post под блокировкой игры, по свежей записи истории"""
+    async with game_locks.lock(key):
+        # Пока ждали блокировку, таймер мог завершить или обновить раздачу
+        entry = get_history_entry(key)
+        if entry is not None:
+            await sync_epic_post(entry, game_info)
+
+
+async def sync_epic_post(entry: dict, game_info: dict):
+    """Приводит пост раздачи Epic Games к актуальным данным"""
+    # Пост правится на месте, заново публикуется только начавшаяся раздача,
+    # пост которой изменить не удалось
+    fingerprint = post_fingerprint(game_info)
+    started = entry.get("status") == "upcoming" and game_info["status"] == "active"
+    # У старых записей нет отпечатка, их трогаем только при старте
+    changed = entry.get("fingerprint") not in (None, fingerprint)
+    if not started and not changed:
+        return
+
+    formatted_text = format_game_post(game_info)
+    reply_markup = get_post_keyboard(None, game_info)
+    if await edit_post(entry, formatted_text, reply_markup):
+        update_history(
+            entry["key"],
+            status=game_info["status"],
+            start_date=game_info["start_date"],
+            end_date=game_info["end_date"],
+            fingerprint=fingerprint,
+        )
+        schedule_giveaway(dict(game_info, key=entry["key"]))
+        logging.info("Обновлен пост раздачи: " + entry["title"])
+    elif started:
+        msg = await send_queue.send(
+            "send_photo",
+            chat_id=CHANNEL_ID,
+            photo=game_info["image_url"],
+            caption=formatted_text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup,
+        )
+        remove_from_history(entry["key"])
+        add_to_history(
+            game_info, "auto", chat_id=msg.chat.id, message_id=msg.message_id
+        )
+        schedule_giveaway(game_info)
+        logging.info("Обновлен статус раздачи: " + entry["title"])
+
+
+def schedule_giveaway(entry: dict):
+    """Ставит таймеры на начало и конец раздачи по записи истории или game_info"""
+    # Скидки Steam дат не имеют и проверяются периодически
+    if entry.get("steam_appid"):
+        return
+    try:
+        if entry.get("status") == "upcoming":
+            start = parse_iso_datetime(entry["start_date"]).timestamp()
+            giveaway_scheduler.schedule(entry["key"], "start", start)
+        else:
+            giveaway_scheduler.cancel(entry["key"], "start")
+        end = parse_iso_datetime(entry["end_date"]).timestamp()
+        giveaway_scheduler.schedule(entry["key"], "end", end)
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(
+            "Не удалось поставить таймеры для "
+            + str(entry.get("title"))
+            + ": "
+            + str(e)
+        )
+
+
+def rebuild_schedule():
+    """Заново ставит таймеры по всей истории (при запуске бота)"""
+    giveaway_scheduler.clear()
+    for entry in get_posted_games():
+        schedule_giveaway(entry)
+    logging.info("Таймеров раздач: " + str(len(giveaway_scheduler)))
+
+
+async def on_giveaway_deadline(key: str, kind: str):
+    """Обрабатывает наступивший срок одной раздачи"""
+    async with game_locks.lock(key):
+        await handle_giveaway_deadline(key, kind)
+
+
+async def handle_giveaway_deadline(key: str, kind: str):
+    entry = get_history_entry(key)
+    if entry is None:
+        return
+
+    if kind == "end":
+        # Дата окончания могла сдвинуться после постановки таймера
+        if datetime.now(pytz.UTC) > parse_iso_datetime(entry["end_date"]):
+            await finish_post(entry, "#egs")
+            logging.info("Завершена раздача EGS: " + entry["title"])
+        else:
+            schedule_giveaway(entry)
+        return
+
+    if entry.get("status") != "upcoming":
+        return
+    game_info = (await deadline_snapshot.index()).get(key)
+    if game_info and game_info["status"] == "active":
+        await sync_epic_post(entry, game_info)
+        return
+    start = parse_iso_datetime(entry["start_date"]).timestamp()
+    if time.time() < start + EPIC_START_RETRY_WINDOW:
+        # Epic переводит раздачу в активные с небольшой задержкой
+        giveaway_scheduler.schedule(key, "start", time.time() + EPIC_START_RETRY)
+
+
+async def check_started_giveaways(snapshot: FreeGamesSnapshot):
+    """Проверяет начавшиеся и изменившиеся раздачи Epic Games"""
     try:
         posted_games = get_posted_games()
-        current_time = datetime.now(pytz.UTC)
+        index = await snapshot.index()
 
         for game in posted_games:
             try:
-                if game.get("status") == "upcoming":
-                    start_time = parse_iso_datetime(game.get("start_date", ""))
-                    if current_time >= start_time:
-                        games = get_free_games()
-                        game_info = next(
-                            (g for g in games if g["title"] == game["title"]), None
-                        )
-
-                        if game_info and game_info["status"] == "active":
-                            formatted_text = format_game_post(game_info)
-                            await bot.send_photo(
-                                chat_id=CHANNEL_ID,
-                                photo=game_info["image_url"],
-                                caption=formatted_text,
-                                parse_mode=ParseMode.HTML,
-                                reply_markup=get_post_keyboard(None, game_info),
-                            )
-
-                            remove_from_history(game["title"])
-                            add_to_history(game_info, "auto")
+                if game.get("steam_appid"):
+                    continue
+                game_info = index.get(game["key"])
+                if not game_info or game_info["status"] == "ended":
+                    continue
 
-                            logging.info("Обновлен статус раздачи: " + game["title"])
+                await asyncio.shield(sync_epic_game(game["key"], game_info))
             except Exception as e:
                 logging.error(
                     "Ошибка при обработке начавшейся раздачи "
@@ -262,43 +667,98 @@ async def check_started_giveaways():
         logging.error("Ошибка при проверке начавшихся раздач: " + str(e))
 
 
-async def periodic_checks():
-    """Периодическая проверка обеих платформ"""
-    while True:
-        try:
-            logging.info("Проверка завершенных раздач")
-            await check_ended_giveaways()
-
-            logging.info("Проверка начавшихся раздач")
-            await check_started_giveaways()
-
-            logging.info("Запуск проверки Epic Games")
-            games = get_free_games()
-            if games:
-                for game in games:
-                    if not is_game_posted(game["title"]):
-                        formatted_text = format_game_post(game)
-                        await bot.send_photo(
-                            chat_id=CHANNEL_ID,
-                            photo=game["image_url"],
-                            caption=formatted_text,
-                            parse_mode=ParseMode.HTML,
-                            reply_markup=get_post_keyboard(None, game),
-                        )
-                        add_to_history(game, "auto")
-                        await asyncio.sleep(2)
+async def check_epic_games() -> Optional[list]:
+    """Проверяет раздачи Epic Games, возвращает их список или None при ошибке"""
+    snapshot = FreeGamesSnapshot(EPIC_REGIONS)
 
-            logging.info("Запуск проверки Steam")
-            await check_steam_deals()
+    logging.info("Проверка начавшихся раздач")
+    await check_started_giveaways(snapshot)
 
-            logging.info(
-                "Проверки завершены, следующая через " + str(CHECK_INTERVAL) + " секунд"
-            )
-            await asyncio.sleep(CHECK_INTERVAL)
+    logging.info("Запуск проверки Epic Games")
+    games = await snapshot.get()
+    if games is None:
+        return None
+
+    async def fetch():
+        for game_info in games:
+            yield game_info
+
+    pipeline = Pipeline(
+        "epic",
+        [dedupe_stage(), render_stage(format_game_post), publish_stage()],
+        queue_size=PIPELINE_QUEUE_SIZE,
+    )
+    await run_pipeline(pipeline, fetch())
+    return games
+
+
+def epic_events(games: list) -> list:
+    """Даты начала и конца текущих раздач Epic Games"""
+    events = []
+    for game in games:
+        for field in ("start_date", "end_date"):
+            try:
+                events.append(parse_iso_datetime(game[field]))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return events
+
+
+async def run_epic_check():
+    """Проверка Epic Games для супервизора, следующую паузу задает epic_poller"""
+    games = await check_epic_games()
+    if games is None:
+        raise RuntimeError("не удалось получить раздачи Epic Games")
+    epic_poller.observe(
+        frozenset((game["key"], game["status"]) for game in games),
+        epic_events(games),
+    )
+
+
+async def run_steam_check():
+    """Проверка скидок Steam для супервизора, следующую паузу задает steam_poller"""
+    logging.info("Запуск проверки Steam")
+    found = await check_steam_deals()
+    if found is None:
+        raise RuntimeError("не удалось проверить скидки Steam")
+    steam_poller.observe(frozenset(found))
 
-        except Exception as e:
-            logging.error("Ошибка при выполнении периодических проверок: " + str(e))
-            await asyncio.sleep(300)
+
+async def run_ended_check():
+    logging.info("Проверка завершенных раздач")
+    await check_ended_giveaways()
+
+
+async def run_housekeeping():
+    """Редкие задачи: каталог Steam и сжатие истории"""
+    if steam_parser.catalog.needs_refresh(STEAM_CATALOG_REFRESH):
+        logging.info("Обновление каталога Steam")
+        await steam_parser.refresh_catalog(STEAM_API_KEY)
+    logging.info("Кэш Steam: " + str(steam_parser.cache_stats()))
+
+    await asyncio.to_thread(compact_history)
+
+
+def create_check(name: str, check, interval) -> SupervisedTask:
+    """Создает проверку с таймаутом и паузами после ошибок из секции [checks]"""
+    return SupervisedTask(
+        name,
+        check,
+        interval,
+        timeout=config.getfloat("checks", name + "_timeout", fallback=900),
+        retry_base=config.getfloat("checks", "retry_base", fallback=30),
+        retry_max=config.getfloat("checks", "retry_max", fallback=1800),
+        jitter=config.getfloat("checks", "jitter", fallback=0.1),
+    )
+
+
+# Проверки работают независимо: медленный Steam не задерживает Epic Games,
+# а ошибка одной проверки не останавливает остальные
+supervisor = Supervisor()
+supervisor.add(create_check("epic", run_epic_check, epic_poller.next_delay))
+supervisor.add(create_check("steam", run_steam_check, steam_poller.next_delay))
+supervisor.add(create_check("ended", run_ended_check, CHECK_INTERVAL))
+supervisor.add(create_check("housekeeping", run_housekeeping, CHECK_INTERVAL))
 
 
 @dp.message(Command("post"))
@@ -310,7 +770,7 @@ async def cmd_post(message: types.Message):
 
     try:
         logging.info("Запрос ручной публикации постов")
-        games = get_free_games()
+        games = await interactive_snapshot.get()
 
         if not games:
             await message.reply(
@@ -321,30 +781,44 @@ async def cmd_post(message: types.Message):
         logging.info("Получено " + str(len(games)) + " игр для предпросмотра")
         preview_msg = await message.reply("🎮 Предпросмотр постов:")
 
+        posts = []
+        tokens = []
         for game in games:
-            try:
-                post_id = f"epic_games_{game['title'].lower().replace(' ', '_')}"
-                formatted_text = format_game_post(game)
+            formatted_text = format_game_post(game)
+            token = previews.register(game, formatted_text)
+            tokens.append(token)
 
-                posted_status = (
-                    "✅ Уже опубликовано"
-                    if is_game_posted(game["title"])
-                    else "⏳ Не опубликовано"
+            posted_status = (
+                "✅ Уже опубликовано" if is_game_posted(game) else "⏳ Не опубликовано"
+            )
+            posts.append(
+                (
+                    game,
+                    f"{formatted_text}\n\n{posted_status}",
+                    get_post_keyboard(token),
                 )
-                formatted_text += f"\n\n{posted_status}"
+            )
 
-                await bot.send_photo(
-                    chat_id=message.chat.id,
-                    photo=game["image_url"],
-                    caption=formatted_text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=get_post_keyboard(post_id),
-                )
-                await asyncio.sleep(1)
-            except Exception as e:
-                error_msg = "Ошибка при отправке поста " + game["title"] + ": " + str(e)
-                logging.error(error_msg)
-                await message.reply(error_msg)
+        async def report_error(chunk: list, e: Exception):
+            titles = ", ".join(game_info["title"] for game_info, _, _ in chunk)
+            error_msg = "Ошибка при отправке поста " + titles + ": " + str(e)
+            logging.error(error_msg)
+            await message.reply(error_msg)
+
+        async for _ in send_photo_posts(
+            message.chat.id, posts, priority=PRIORITY_PREVIEW, on_error=report_error
+        ):
+            pass
+
+        if TELEGRAM_MEDIA_GROUPS and len(games) > 1:
+            # У альбома нет кнопок, публикация - из отдельного сообщения
+            await send_queue.send(
+                "send_message",
+                chat_id=message.chat.id,
+                text="Выберите игры для публикации:",
+                reply_markup=get_batch_keyboard(games, tokens),
+                priority=PRIORITY_PREVIEW,
+            )
 
         await preview_msg.delete()
 
@@ -359,6 +833,9 @@ async def process_callback(callback_query: types.CallbackQuery):
     """Обработка нажатий на кнопки"""
     try:
         if callback_query.data == "steam_search_cancel":
+            search_sessions.close(
+                callback_query.message.chat.id, callback_query.message.message_id
+            )
             await callback_query.message.delete()
             await callback_query.answer("Поиск отменен")
             return
@@ -369,14 +846,15 @@ async def process_callback(callback_query: types.CallbackQuery):
                 return
 
             page = int(callback_query.data.split("_")[2])
-            if not hasattr(bot, "steam_search_results"):
+            session = search_sessions.get(
+                callback_query.message.chat.id, callback_query.message.message_id
+            )
+            if session is None:
                 await callback_query.answer("Поиск устарел, выполните новый поиск")
                 return
 
             await callback_query.message.edit_reply_markup(
-                reply_markup=create_steam_search_keyboard(
-                    bot.steam_search_results, page
-                )
+                reply_markup=session.keyboard(page)
             )
             await callback_query.answer()
             return
@@ -388,73 +866,104 @@ async def process_callback(callback_query: types.CallbackQuery):
             )
 
             if game_info:
-                formatted_text = format_steam_post(game_info)
-                await bot.send_photo(
-                    chat_id=callback_query.message.chat.id,
-                    photo=game_info["image_url"],
-                    caption=formatted_text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=get_post_keyboard(f"steam_{app_id}"),
+                await send_steam_preview(callback_query.message.chat.id, game_info)
+                search_sessions.close(
+                    callback_query.message.chat.id, callback_query.message.message_id
                 )
                 await callback_query.message.delete()
             else:
                 await callback_query.answer("Ошибка: игра не найдена")
             return
 
-        action, post_id = callback_query.data.split("_", 1)
+        action, token = callback_query.data.split("_", 1)
 
         if action == "delete":
+            previews.discard(token)
             await callback_query.message.delete()
             await callback_query.answer("Пост удален")
 
         elif action == "post":
-            if post_id.startswith("steam_"):
-                app_id = post_id.replace("steam_", "")
-                game_info = steam_parser.get_game_by_id(app_id)
-                if game_info:
-                    formatted_text = format_steam_post(game_info)
-                    await bot.send_photo(
-                        chat_id=CHANNEL_ID,
-                        photo=game_info["image_url"],
-                        caption=formatted_text,
-                        parse_mode=ParseMode.HTML,
-                        reply_markup=get_post_keyboard(None, game_info),
-                    )
-                    add_to_history(game_info, "manual")
-                    await callback_query.message.delete()
-                    await callback_query.answer("Пост опубликован в канал")
-            else:
-                games = get_free_games()
-                game_title = post_id.replace("epic_games_", "").replace("_", " ")
-                game_info = next(
-                    (
-                        game
-                        for game in games
-                        if game["title"].lower() == game_title.lower()
-                    ),
-                    None,
+            # Публикуется ровно то, что было в предпросмотре, без повторных запросов
+            # Токен забирается до отправки: двойное нажатие не опубликует пост дважды
+            preview = previews.pop(token)
+            if preview is None:
+                await callback_query.answer(
+                    "Предпросмотр устарел или уже опубликован"
                 )
+                return
 
-                if game_info:
-                    formatted_text = format_game_post(game_info)
-                    await bot.send_photo(
-                        chat_id=CHANNEL_ID,
-                        photo=game_info["image_url"],
-                        caption=formatted_text,
-                        parse_mode=ParseMode.HTML,
-                        reply_markup=get_post_keyboard(None, game_info),
-                    )
-                    add_to_history(game_info, "manual")
-                    await callback_query.message.delete()
-                    await callback_query.answer("Пост опубликован в канал")
-                else:
-                    await callback_query.answer("Ошибка: игра не найдена")
+            game_info = preview["game_info"]
+            try:
+                msg = await send_queue.send(
+                    "send_photo",
+                    chat_id=CHANNEL_ID,
+                    photo=game_info["image_url"],
+                    caption=preview["caption"],
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=get_post_keyboard(None, game_info),
+                )
+            except Exception:
+                previews.restore(token, preview)
+                raise
+            add_to_history(
+                game_info, "manual", chat_id=msg.chat.id, message_id=msg.message_id
+            )
+            schedule_giveaway(game_info)
+            await remove_preview_button(callback_query)
+            await callback_query.answer("Пост опубликован в канал")
 
     except Exception as e:
         logging.error("Ошибка при обработке callback: " + str(e))
         await callback_query.answer(f"Произошла ошибка: {str(e)}")
 
 
+async def remove_preview_button(callback_query: types.CallbackQuery):
+    """Убирает отработавший предпросмотр"""
+    # Из сообщения с кнопками для альбома убирается только нажатая кнопка
+    message = callback_query.message
+    if message.photo or not message.reply_markup:
+        await message.delete()
+        return
+
+    rows = [
+        row
+        for row in message.reply_markup.inline_keyboard
+        if row[0].callback_data != callback_query.data
+    ]
+    if rows:
+        await message.edit_reply_markup(
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=rows)
+        )
+    else:
+        await message.delete()
+
+
+async def send_steam_preview(chat_id, game_info: dict):
+    """Отправляет админу предпросмотр поста Steam с кнопками публикации"""
+    formatted_text = format_steam_post(game_info)
+    await send_queue.send(
+        "send_photo",
+        chat_id=chat_id,
+        photo=game_info["image_url"],
+        caption=formatted_text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=get_post_keyboard(previews.register(game_info, formatted_text)),
+        priority=PRIORITY_PREVIEW,
+    )
+
+
+async def reply_search_results(message: types.Message, query: str):
+    """Ищет игры в Steam и отвечает клавиатурой с результатами"""
+    games = await search_steam_games(query)
+    if not games:
+        await message.reply("Игры не найдены")
+        return
+
+    session = SearchSession(games)
+    reply = await message.reply("Результаты поиска:", reply_markup=session.keyboard())
+    search_sessions.add(reply.chat.id, reply.message_id, session)
+
+
 @dp.message(Command("steam_search"))
 async def cmd_steam_search(message: types.Message):
     """Поиск игры в Steam по названию"""
@@ -466,14 +975,7 @@ async def cmd_steam_search(message: types.Message):
         await message.reply("Укажите название игры после команды")
         return
 
-    games = await search_steam_games(query)
-    if not games:
-        await message.reply("Игры не найдены")
-        return
-
-    await message.reply(
-        "Результаты поиска:", reply_markup=create_steam_search_keyboard(games)
-    )
+    await reply_search_results(message, query)
 
 
 @dp.message(Command("steam_url"))
@@ -492,14 +994,7 @@ async def cmd_steam_url(message: types.Message):
         await message.reply("Не удалось получить информацию об игре")
         return
 
-    formatted_text = format_steam_post(game_info)
-    await bot.send_photo(
-        chat_id=message.chat.id,
-        photo=game_info["header_image"],
-        caption=formatted_text,
-        parse_mode=ParseMode.HTML,
-        reply_markup=get_post_keyboard(f"steam_{game_info['steam_appid']}"),
-    )
+    await send_steam_preview(message.chat.id, game_info)
 
 
 @dp.message(Command("test"))
@@ -507,12 +1002,15 @@ async def cmd_test(message: types.Message):
     """Тест: публикует сообщение, редактирует через 5 секунд, удаляет через 5 секунд и сообщает админу"""
     if str(message.from_user.id) != os.getenv("ADMIN_ID"):
         return
-    test_msg = await bot.send_message(
-        chat_id=CHANNEL_ID, text="Тестовое сообщение: первоначальный текст"
+    test_msg = await send_queue.send(
+        "send_message",
+        chat_id=CHANNEL_ID,
+        text="Тестовое сообщение: первоначальный текст",
     )
     await asyncio.sleep(5)
     try:
-        await bot.edit_message_text(
+        await send_queue.send(
+            "edit_message_text",
             chat_id=test_msg.chat.id,
             message_id=test_msg.message_id,
             text="Тестовое сообщение: отредактировано",
@@ -521,26 +1019,14 @@ async def cmd_test(message: types.Message):
         pass
     await asyncio.sleep(5)
     try:
-        await bot.delete_message(
-            chat_id=test_msg.chat.id, message_id=test_msg.message_id
+        await send_queue.send(
+            "delete_message", chat_id=test_msg.chat.id, message_id=test_msg.message_id
         )
     except Exception:
         pass
     await bot.send_message(chat_id=message.from_user.id, text="Тест успешно завершен")
 
 
-@dp.callback_query(lambda c: c.data.startswith("steam_page_"))
-async def process_steam_page(callback_query: types.CallbackQuery):
-    page = int(callback_query.data.split("_")[2])
-    if not hasattr(bot, "steam_search_results"):
-        await callback_query.answer("Поиск устарел, выполните новый поиск")
-        return
-
-    await callback_query.message.edit_reply_markup(
-        reply_markup=create_steam_search_keyboard(bot.steam_search_results, page)
-    )
-
-
 async def send_help_message(message: types.Message):
     """Отправляет сообщние с помощью"""
     help_text = [
@@ -590,26 +1076,10 @@ async def handle_message(message: types.Message):
             await message.reply("Не удалось получить информацию об игре")
             return
 
-        formatted_text = format_steam_post(game_info)
-        await bot.send_photo(
-            chat_id=message.chat.id,
-            photo=game_info["image_url"],
-            caption=formatted_text,
-            parse_mode=ParseMode.HTML,
-            reply_markup=get_post_keyboard(f"steam_{game_info['steam_appid']}"),
-        )
+        await send_steam_preview(message.chat.id, game_info)
 
     else:
-        games = await search_steam_games(text)
-        if not games:
-            await message.reply("Игры не найдены")
-            return
-
-        bot.steam_search_results = games
-
-        await message.reply(
-            "Результаты поиска:", reply_markup=create_steam_search_keyboard(games)
-        )
+        await reply_search_results(message, text)
 
 
 def parse_iso_datetime(s: str) -> datetime:
@@ -623,8 +1093,18 @@ def parse_iso_datetime(s: str) -> datetime:
 
 
 async def main():
-    asyncio.create_task(periodic_checks())
-    await dp.start_polling(bot)
+    send_queue.start()
+    rebuild_schedule()
+    asyncio.create_task(giveaway_scheduler.run(on_giveaway_deadline))
+    supervisor.start()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await supervisor.stop()
+        await send_queue.stop()
+        await steam_parser.close()
+        await async_http_client.close()
+        http_client.close()
 
 
 if __name__ == "__main__":
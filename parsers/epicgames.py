@@ -1,6 +1,15 @@
-import requests
-import json
+import asyncio
+import hashlib
+import time
 from datetime import datetime
+from game_keys import epic_game_key, index_by_key
+from http_client import AsyncHttpClient, HttpClientError, async_http_client
+
+FREE_GAMES_URL = "https://store-site-backend-static.ak.epicgames.com/freeGamesPromotions"
+DEFAULT_REGIONS = ('US', 'RU')
+
+# Кэш ответов по регионам: валидаторы ETag/Last-Modified, хэш тела и разобранный список игр
+_region_cache = {}
 
 def create_game_info(game, offer, status, available_in_russia=None):
     """Создает словарь с информацией об игре"""
@@ -10,6 +19,7 @@ def create_game_info(game, offer, status, available_in_russia=None):
         "USD": {"original": -1, "current": -1}
     }
     
+    currency = None
     if game.get('price'):
         total_price = game['price'].get('totalPrice', {})
         discount = offer['discountSetting']['discountPercentage']
@@ -18,16 +28,18 @@ def create_game_info(game, offer, status, available_in_russia=None):
         current_price = total_price.get('discountPrice', original_price) / 100
         
         currency = total_price.get('currencyCode', 'USD')
-        if currency in price_info:
-            price_info[currency] = {
-                "original": original_price,
-                "current": current_price
-            }
-            price_info["discount"] = discount
+        price_info[currency] = {
+            "original": original_price,
+            "current": current_price
+        }
+        price_info["discount"] = discount
 
     url = "https://store.epicgames.com/ru/p/" + game['catalogNs']['mappings'][0]['pageSlug']
 
     return {
+        'key': epic_game_key(game['namespace'], game['id']),
+        'namespace': game['namespace'],
+        'offer_id': game['id'],
         'title': game['title'],
         'publisher': game.get('seller', {}).get('name'),
         'status': status,
@@ -36,6 +48,7 @@ def create_game_info(game, offer, status, available_in_russia=None):
         'url': url,
         'image_url': game.get('keyImages', [{}])[0].get('url'),
         'price': price_info,
+        'currency': currency,
         'available_in_russia': available_in_russia
     }
 
@@ -48,61 +61,168 @@ def process_offers(game, offers, status, available_in_russia=None):
                 games_list.append(create_game_info(game, offer, status, available_in_russia))
     return games_list
 
-def get_free_games_for_region(region):
+def parse_free_games(data):
+    """Разбирает ответ freeGamesPromotions в список игр"""
+    games = []
+    for game in data['data']['Catalog']['searchStore']['elements']:
+        if not game.get('promotions'):
+            continue
+            
+        promotional_offers = game['promotions'].get('promotionalOffers', [])
+        upcoming_offers = game['promotions'].get('upcomingPromotionalOffers', [])
+        
+        games.extend(process_offers(game, promotional_offers, 'active', None))
+        games.extend(process_offers(game, upcoming_offers, 'upcoming', None))
+        
+    return games
+
+async def get_free_games_for_region(client, region):
     """Получает список бесплатных игр для конкретного региона"""
-    url = "https://store-site-backend-static.ak.epicgames.com/freeGamesPromotions"
     params = {
         "locale": "en-US",
         "country": region,
         "allowCountries": region
     }
     
+    cached = _region_cache.get(region)
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    
     try:
-        response = requests.get(url, params=params)
+        response = await client.get(FREE_GAMES_URL, params=params, headers=headers)
+        if response.status == 304 and cached:
+            return cached['games']
         response.raise_for_status()
-        data = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
         
-        games = []
-        for game in data['data']['Catalog']['searchStore']['elements']:
-            if not game.get('promotions'):
-                continue
-                
-            promotional_offers = game['promotions'].get('promotionalOffers', [])
-            upcoming_offers = game['promotions'].get('upcomingPromotionalOffers', [])
-            
-            games.extend(process_offers(game, promotional_offers, 'active', None))
-            games.extend(process_offers(game, upcoming_offers, 'upcoming', None))
-            
+        body_hash = hashlib.sha256(response.body).hexdigest()
+        if cached and cached['body_hash'] == body_hash:
+            games = cached['games']
+        else:
+            games = parse_free_games(response.json())
+        _region_cache[region] = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'body_hash': body_hash,
+            'games': games
+        }
         return games
         
-    except requests.exceptions.RequestException as e:
+    except (HttpClientError, ValueError) as e:
         error_msg = "Ошибка при получении данных для региона " + region + ": " + str(e)
         print(error_msg)
         return None
 
-def get_free_games():
-    """Основная функция получения и сравнения списков игр"""
-    us_games = get_free_games_for_region('US')
-    ru_games = get_free_games_for_region('RU')
-    if not us_games and not ru_games:
-        return None
-        
-    us_titles = {game['title']: game for game in us_games}
+def merge_regions(region_games):
+    """Объединяет списки игр разных регионов по ключу игры
+
+    У каждой игры появляется карта regions: регион -> доступность и цена.
+    """
+    merged = {}
+    for region, games in region_games.items():
+        for game in games:
+            final_game = merged.get(game['key'])
+            if final_game is None:
+                final_game = dict(game, price=dict(game['price']), regions={})
+                merged[game['key']] = final_game
+            currency = game.get('currency')
+            region_info = {'available': True, 'currency': currency}
+            if currency:
+                region_info.update(game['price'][currency])
+                final_game['price'][currency] = game['price'][currency]
+            final_game['regions'][region] = region_info
     
-    final_games = []
-    for ru_game in ru_games:
-        ru_game['available_in_russia'] = ru_game['title'] in us_titles
-        if ru_game['title'] in us_titles:
-            us_price = us_titles[ru_game['title']]['price']['USD']
-            ru_game['price']['USD'] = us_price
-        final_games.append(ru_game)
+    for final_game in merged.values():
+        for region in region_games:
+            final_game['regions'].setdefault(region, {'available': False})
+        if 'RU' in region_games:
+            final_game['available_in_russia'] = final_game['regions']['RU']['available']
     
-    for us_game in us_games:
-        if not any(game['title'] == us_game['title'] for game in ru_games):
-            us_game['available_in_russia'] = False
-            final_games.append(us_game)
+    return list(merged.values())
+
+async def fetch_free_games(regions=DEFAULT_REGIONS, client=async_http_client):
+    """Параллельно получает игры по всем регионам и объединяет их
+
+    Если регион не ответил, берется его последний удачный ответ. Когда его
+    нет, вся выборка считается неудачной (None): без региона у игр не будет
+    его цены и доступности.
+    """
+    results = await asyncio.gather(
+        *(get_free_games_for_region(client, region) for region in regions)
+    )
+    
+    region_games = {}
+    for region, games in zip(regions, results):
+        if games is None:
+            cached = _region_cache.get(region)
+            if cached is None:
+                return None
+            print("Для региона " + region + " используются данные прошлого запроса")
+            games = cached['games']
+        region_games[region] = games
+    if not any(region_games.values()):
+        return None
     
-    return final_games
+    return merge_regions(region_games)
+
+class FreeGamesSnapshot:
+    """Снимок раздач Epic Games, который разделяют все проверки цикла
+
+    Данные запрашиваются один раз при первом обращении и живут до конца
+    цикла (ttl=None) или ttl секунд для интерактивных обработчиков.
+    """
+
+    def __init__(self, regions=DEFAULT_REGIONS, ttl=None):
+        self.regions = regions
+        self.ttl = ttl
+        self._games = None
+        self._index = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        if self._games is None:
+            return False
+        return self.ttl is None or time.monotonic() - self._fetched_at < self.ttl
+
+    async def get(self):
+        """Возвращает список игр, запрашивая его только при необходимости"""
+        async with self._lock:
+            if not self._is_fresh():
+                games = await fetch_free_games(self.regions)
+                if games is not None:
+                    self._games = games
+                    self._index = None
+                    self._fetched_at = time.monotonic()
+        return self._games
+
+    async def index(self):
+        """Возвращает словарь игр по ключу"""
+        games = await self.get()
+        if self._index is None and games is not None:
+            self._index = index_by_key(games)
+        return self._index or {}
+
+    def invalidate(self):
+        """Сбрасывает снимок, следующий get() запросит данные заново"""
+        self._games = None
+        self._index = None
+
+def get_free_games(regions=DEFAULT_REGIONS):
+    """Синхронная обертка над fetch_free_games"""
+    async def run():
+        # Общий клиент принадлежит event loop бота, здесь нужен свой
+        client = AsyncHttpClient()
+        try:
+            return await fetch_free_games(regions, client)
+        finally:
+            await client.close()
+    return asyncio.run(run())
 
 if __name__ == "__main__":
     games = get_free_games()
@@ -1,154 +1,388 @@
-import requests
+import asyncio
+import html as html_lib
 import re
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
-from bs4 import BeautifulSoup
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from bs4 import BeautifulSoup, SoupStrainer
+from game_keys import normalize_title, steam_game_key
+from cache import MISSING, SingleFlight, TTLCache
+from http_client import DEFAULT_CONFIG, AsyncHttpClient, HttpClient, async_http_client, http_client
+from ratelimit import TokenBucket
+from parsers.steam_catalog import APP_LIST_URL, STORE_APP_LIST_PAGE, STORE_APP_LIST_URL, SteamCatalog, is_probably_game
 
-class SteamParser:
-    def __init__(self):
+DEFAULT_CC = "RU"
+LANGUAGE = "russian"
+# Регионы, для которых показываются цены: код страны -> валюта
+PRICE_REGIONS = {"RU": "RUB", "KZ": "KZT"}
+PRICE_BATCH_SIZE = 100
+SEARCH_LIMIT = 100
+
+# Кэш результатов поиска по нормализованному запросу
+SEARCH_CACHE_SIZE = 256
+SEARCH_TTL = 15 * 60
+
+# Кэш appdetails: описание игры меняется редко, цена - часто
+DETAILS_CACHE_SIZE = 2048
+STATIC_TTL = 24 * 3600
+PRICE_TTL = 10 * 60
+NEGATIVE_TTL = 3600
+# Метка в кэше для app id, о которых Steam ответил success=false
+NOT_FOUND = object()
+
+# Store API Steam пускает около 200 запросов за 5 минут с одного IP
+STORE_RATE = 200 / 300
+STORE_BURST = 10
+# Список приложений весит десятки мегабайт и идет не через Store API:
+# свой таймаут, без лимита магазина и без многократных повторов
+CATALOG_TIMEOUT = 300
+CATALOG_RETRIES = 1
+
+try:
+    import lxml  # noqa: F401
+    SOUP_FEATURES = 'lxml'
+except ImportError:
+    SOUP_FEATURES = 'html.parser'
+
+# Разбор строк поиска Steam без построения DOM
+_ROW_CLASS = re.compile(r'\bsearch_result_row\b')
+_ROW_START = re.compile(r'<a\b[^>]*\bsearch_result_row\b[^>]*>')
+_ROW_APPID = re.compile(r'data-ds-appid="(\d+)"')
+_ROW_HREF = re.compile(r'href="([^"]*)"')
+_ROW_TITLE = re.compile(r'<span class="title">(.*?)</span>', re.S)
+_ROW_DISCOUNT = re.compile(r'data-discount="(\d+)"')
+_ROW_PRICE_FINAL = re.compile(r'data-price-final="(\d+)"')
+
+class SteamParserBase:
+    """Общая часть парсеров Steam без запросов: параметры, разбор ответов и кэши
+
+    Запросы делают наследники: SteamParser синхронно, AsyncSteamParser
+    асинхронно. Их методы называются одинаково, но друг друга не заменяют.
+    """
+
+    def __init__(self, price_regions: Optional[Dict[str, str]] = None, catalog: Optional[SteamCatalog] = None):
         self.base_url = "https://store.steampowered.com/api"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
+        self.search_url = "https://store.steampowered.com/search/"
+        self.price_regions = price_regions or PRICE_REGIONS
+        self.catalog = catalog
+        self._details_cache = TTLCache(DETAILS_CACHE_SIZE, STATIC_TTL)
+        self._price_cache = TTLCache(DETAILS_CACHE_SIZE, PRICE_TTL)
+        self._search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_TTL)
 
-    def search_games(self, query: str) -> List[Dict]:
-        """Поиск игр в Steam по названию"""
-        if not query or query.strip().lower() in ('free', 'бесплатно'):
-            return self.search_free_games()
-        
-        url = f"{self.base_url}/storesearch/"
-        params = {
+    @staticmethod
+    def is_free_query(query: str) -> bool:
+        return not query or query.strip().lower() in ('free', 'бесплатно')
+
+    @staticmethod
+    def _search_params(query: str) -> Dict:
+        return {
             'term': query,
-            'l': 'russian',
-            'cc': 'RU',
+            'l': LANGUAGE,
+            'cc': DEFAULT_CC,
             'page': 1,
-            'page_size': 100,
+            'page_size': SEARCH_LIMIT,
             'infinite': 1
         }
-        
+
+    @staticmethod
+    def _sort_search_items(query: str, data: Dict) -> List[Dict]:
+        items = data.get('items', [])
+
+        items.sort(key=lambda x: x.get('name', '').lower().startswith(query.lower()), reverse=True)
+
+        print(f"Found {len(items)} items before limit")
+
+        return items[:SEARCH_LIMIT]
+
+    @staticmethod
+    def _matches_query(norm_query: str, name: str) -> bool:
+        """Совпадает ли название с запросом так же, как в поиске по каталогу:
+        по началу названия или по всем словам (последнее - префикс)
+        """
+        norm_name = normalize_title(name)
+        if norm_name.startswith(norm_query):
+            return True
+        *words, last = norm_query.split()
+        tokens = norm_name.split()
+        return all(word in tokens for word in words) and any(token.startswith(last) for token in tokens)
+
+    def _cache_search(self, norm_query: str, items: List[Dict], complete: bool):
+        """Кладет результат поиска в кэш; complete - в нем все игры, подходящие под запрос"""
+        self._search_cache.set(norm_query, (items, complete))
+
+    def _cached_search(self, norm_query: str) -> Optional[List[Dict]]:
+        """Результат поиска из кэша
+
+        Если точного запроса нет, берется закэшированный более короткий запрос,
+        который является его префиксом, и фильтруется. Так можно только с
+        полными результатами: поиск по каталогу, не обрезанный лимитом.
+        Выдача storesearch нечеткая и обрезается самим Steam, поэтому для
+        более длинного запроса она может не содержать нужных игр.
+        """
+        cached = self._search_cache.get(norm_query, MISSING)
+        if cached is not MISSING:
+            return cached[0]
+        for end in range(len(norm_query) - 1, 0, -1):
+            broader = self._search_cache.peek(norm_query[:end], MISSING)
+            if broader is MISSING or not broader[1]:
+                continue
+            items = [item for item in broader[0] if self._matches_query(norm_query, item.get('name', ''))]
+            self._cache_search(norm_query, items, True)
+            return items
+        return None
+
+    def search_catalog(self, query: str) -> List[Dict]:
+        """Поиск по локальному каталогу приложений, пустой список если каталога нет"""
+        if self.catalog is None:
+            return []
         try:
-            response = requests.get(url, params=params, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
-            items = data.get('items', [])
-            
-            items.sort(key=lambda x: x.get('name', '').lower().startswith(query.lower()), reverse=True)
-            
-            print(f"Found {len(items)} items before limit")
-            
-            return items[:100]
+            items = self.catalog.search(query)
         except Exception as e:
-            print(f"Error searching games: {e}")
+            print(f"Error searching local catalog: {e}")
             return []
+        if items:
+            print(f"Found {len(items)} items in local catalog")
+        return items
 
-    def search_free_games(self) -> List[Dict]:
-        """Поиск бесплатных игр в Steam по ссылке фильтрации"""
-        url = "https://store.steampowered.com/search/"
-        params = {
+    def _search_uncached(self, query: str) -> Tuple[List[Dict], bool]:
+        """Поиск по каталогу: (результат, полон ли он)"""
+        items = self.search_catalog(query)
+        return items, bool(items) and len(items) < SEARCH_LIMIT
+
+    @staticmethod
+    def _free_games_params() -> Dict:
+        return {
             'maxprice': 'free',
             'specials': '1',
             'ndl': '1',
             'as-discount-percent': '100-',
-            'l': 'russian',
-            'cc': 'RU'
+            'l': LANGUAGE,
+            'cc': DEFAULT_CC
         }
-        try:
-            response = requests.get(url, params=params, headers=self.headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            rows = soup.select('a.search_result_row')
-            items = []
-            for row in rows:
-                app_id = row.get('data-ds-appid')
-                title_elem = row.select_one('span.title')
-                if not app_id or not title_elem:
-                    continue
-                items.append({
-                    'id': int(app_id),
-                    'name': title_elem.text.strip(),
-                    'url': row.get('href')
-                })
-            print(f"Found {len(items)} free games")
+
+    @classmethod
+    def parse_search_results(cls, html: str) -> List[Dict]:
+        """Извлекает игры из HTML страницы поиска Steam
+
+        Строки разбираются iter_search_rows без построения DOM. Если так ничего
+        не нашлось, хотя строки выдачи в странице есть (поменялась разметка),
+        используется разбор через BeautifulSoup.
+        """
+        items = [
+            {'id': row['id'], 'name': row['name'], 'url': row['url']}
+            for row in cls.iter_search_rows(html)
+        ]
+        if items or 'search_result_row' not in html:
             return items
-        except Exception as e:
-            print(f"Error searching free games: {e}")
-            return []
+        return cls.parse_search_results_soup(html)
+
+    @staticmethod
+    def parse_search_results_soup(html: str) -> List[Dict]:
+        """Извлекает игры из HTML через BeautifulSoup, разбирая только строки выдачи"""
+        soup = BeautifulSoup(html, SOUP_FEATURES, parse_only=SoupStrainer('a', class_=_ROW_CLASS))
+        rows = soup.select('a.search_result_row')
+        items = []
+        for row in rows:
+            app_id = row.get('data-ds-appid')
+            title_elem = row.select_one('span.title')
+            if not app_id or not title_elem:
+                continue
+            items.append({
+                'id': int(app_id),
+                'name': title_elem.text.strip(),
+                'url': row.get('href')
+            })
+        return items
+
+    @staticmethod
+    def iter_search_rows(html: str) -> Iterator[Dict]:
+        """Построчно извлекает игры из HTML выдачи поиска Steam
+
+        Кроме id, названия и ссылки возвращает скидку и итоговую цену.
+        Строки наборов (несколько app id) пропускаются.
+        """
+        starts = _ROW_START.finditer(html)
+        current = next(starts, None)
+        while current is not None:
+            following = next(starts, None)
+            end = following.start() if following else len(html)
+            tag = current.group(0)
+            body = html[current.end():end]
+            current = following
+
+            app_id = _ROW_APPID.search(tag)
+            title = _ROW_TITLE.search(body)
+            if not app_id or not title:
+                continue
+            href = _ROW_HREF.search(tag)
+            discount = _ROW_DISCOUNT.search(body)
+            price_final = _ROW_PRICE_FINAL.search(body)
+            yield {
+                'id': int(app_id.group(1)),
+                'name': html_lib.unescape(title.group(1)).strip(),
+                'url': html_lib.unescape(href.group(1)) if href else None,
+                'discount': int(discount.group(1)) if discount else 0,
+                'price': int(price_final.group(1)) / 100 if price_final else -1
+            }
+
+    @staticmethod
+    def _specials_params(min_discount: int, start: int, count: int) -> Dict:
+        params = {
+            'specials': '1',
+            'ndl': '1',
+            'infinite': '1',
+            'start': start,
+            'count': count,
+            'l': LANGUAGE,
+            'cc': DEFAULT_CC
+        }
+        if min_discount >= 100:
+            # Для 100% скидок Steam фильтрует сам, выдача получается короткой
+            params['maxprice'] = 'free'
+        return params
 
     def get_app_id_from_url(self, url: str) -> Optional[str]:
         """Извлекает app_id из URL игры"""
         match = re.search(r'/app/(\d+)/', url)
         return match.group(1) if match else None
 
-    def get_game_details(self, app_id: str, currency: str = "RUB") -> Optional[Dict]:
-        """Получает информацию об игре через Steam API"""
-        url = f"{self.base_url}/appdetails"
-        params = {
+    def cache_stats(self) -> Dict[str, Dict]:
+        """Счетчики попаданий и промахов кэшей appdetails"""
+        return {
+            "details": self._details_cache.stats(),
+            "prices": self._price_cache.stats(),
+            "search": self._search_cache.stats()
+        }
+
+    def _cached_details(self, app_id: str, cc: str):
+        """Ищет appdetails в кэше: описание и цену по отдельности
+
+        Возвращает (описание или MISSING/NOT_FOUND, price_overview или MISSING).
+        """
+        static = self._details_cache.get((str(app_id), cc, LANGUAGE), MISSING)
+        if static is MISSING or static is NOT_FOUND:
+            return static, MISSING
+        return static, self._price_cache.get((str(app_id), cc), MISSING)
+
+    def _store_details(self, app_id: str, cc: str, data: Optional[Dict]):
+        """Кладет ответ appdetails в кэши, пустой ответ кэшируется как NOT_FOUND"""
+        key = (str(app_id), cc, LANGUAGE)
+        if not data:
+            self._details_cache.set(key, NOT_FOUND, NEGATIVE_TTL)
+            return
+        static = {k: v for k, v in data.items() if k != "price_overview"}
+        self._details_cache.set(key, static)
+        self._price_cache.set((str(app_id), cc), data.get("price_overview", {}))
+
+    @staticmethod
+    def _with_price(static: Dict, overview: Dict) -> Dict:
+        data = dict(static)
+        if overview:
+            data["price_overview"] = overview
+        return data
+
+    @staticmethod
+    def _details_params(app_id: str, cc: str) -> Dict:
+        return {
             "appids": app_id,
-            "cc": currency,
-            "l": "russian"
+            "cc": cc,
+            "l": LANGUAGE
         }
-        
-        try:
-            response = requests.get(url, params=params, headers=self.headers)
-            response.raise_for_status()
-            data = response.json().get(str(app_id), {}).get("data", {})
-            return data if data else None
-        except Exception as e:
-            print(f"Error getting game details: {e}")
-            return None
 
-    def format_game_info(self, game_data: Dict) -> Dict:
-        """Форматирует информацию об игре в единый формат"""
-        is_free = game_data.get("is_free", False)
-        status = 'active'
-        post_time = datetime.now().isoformat()
-        start_date = post_time
-        end_date = post_time
-        
-        ru_data = self.get_game_details(game_data['steam_appid'], 'RU')
-        kz_data = self.get_game_details(game_data['steam_appid'], 'KZ')
-        
-        ru_price_info = ru_data.get("price_overview", {}) if ru_data else {}
-        kz_price_info = kz_data.get("price_overview", {}) if kz_data else {}
-        
-        price = {
-            "discount": 0,
-            "RUB": {
-                "original": -1,
-                "current": -1
-            },
-            "KZT": {
+    def _price_batches(self, app_ids: List[str], regions: Optional[List[str]]) -> Tuple[Dict, List[Tuple[str, List[str]]]]:
+        """Делит запрос цен на найденное в кэше и пачки (регион, app_id) для запроса"""
+        regions = list(self.price_regions) if regions is None else regions
+        app_ids = list(dict.fromkeys(str(app_id) for app_id in app_ids))
+        result = {}
+        batches = []
+        for cc in regions:
+            uncached = []
+            for app_id in app_ids:
+                overview = self._price_cache.get((app_id, cc), MISSING)
+                if overview is MISSING:
+                    uncached.append(app_id)
+                else:
+                    if result.get(app_id) is None:
+                        result[app_id] = {}
+                    result[app_id][cc] = overview
+            for i in range(0, len(uncached), PRICE_BATCH_SIZE):
+                batches.append((cc, uncached[i:i + PRICE_BATCH_SIZE]))
+        return result, batches
+
+    @staticmethod
+    def _price_params(cc: str, chunk: List[str]) -> Dict:
+        return {
+            "appids": ",".join(chunk),
+            "cc": cc,
+            "filters": "price_overview"
+        }
+
+    def _apply_price_batch(self, result: Dict, cc: str, chunk: List[str], data: Dict):
+        """Раскладывает ответ пакетного запроса цен по результату и кэшу"""
+        for app_id in chunk:
+            app_data = data.get(app_id) or {}
+            if not app_data.get("success"):
+                result.setdefault(app_id, None)
+                continue
+            # Для игр без цены Steam возвращает пустой список вместо словаря
+            overview = (app_data.get("data") or {}).get("price_overview", {})
+            self._price_cache.set((app_id, cc), overview)
+            if result.get(app_id) is None:
+                result[app_id] = {}
+            result[app_id][cc] = overview
+
+    def _prices_from_overviews(self, price_overviews: Dict[str, Optional[Dict]]) -> Dict[str, Optional[Dict]]:
+        prices = {}
+        for app_id, overviews in price_overviews.items():
+            if overviews is None:
+                prices[app_id] = None
+            elif DEFAULT_CC in overviews:
+                # Без основного региона скидка неизвестна, такие игры пропускаем
+                prices[app_id] = self.build_price(overviews)
+        return prices
+
+    def build_price(self, overviews: Dict[str, Dict], title: str = "") -> Dict:
+        """Собирает словарь цен из price_overview по регионам"""
+        price = {"discount": 0}
+        for cc, currency in self.price_regions.items():
+            price[currency] = {
                 "original": -1,
                 "current": -1
             }
-        }
-        
-        if ru_price_info:
+            price_info = overviews.get(cc) or {}
+            if not price_info:
+                continue
             try:
-                initial = ru_price_info.get("initial", 0)
-                final = ru_price_info.get("final", 0)
-                
-                if initial > 0:
-                    price["RUB"]["original"] = initial / 100
-                if final > 0:
-                    price["RUB"]["current"] = final / 100
-                price["discount"] = ru_price_info.get("discount_percent", 0)
-            except (TypeError, ValueError) as e:
-                print(f"Error processing RUB price for game {game_data.get('name')}: {e}")
-        
-        if kz_price_info:
-            try:
-                initial = kz_price_info.get("initial", 0)
-                final = kz_price_info.get("final", 0)
-                
+                initial = price_info.get("initial", 0)
+                final = price_info.get("final", 0)
+
                 if initial > 0:
-                    price["KZT"]["original"] = initial / 100
+                    price[currency]["original"] = initial / 100
                 if final > 0:
-                    price["KZT"]["current"] = final / 100
+                    price[currency]["current"] = final / 100
+                if cc == DEFAULT_CC:
+                    price["discount"] = price_info.get("discount_percent", 0)
             except (TypeError, ValueError) as e:
-                print(f"Error processing KZT price for game {game_data.get('name')}: {e}")
-        
+                print(f"Error processing {currency} price for game {title}: {e}")
+        return price
+
+    def _missing_regions(self, overviews: Dict[str, Dict]) -> List[str]:
+        return [cc for cc in self.price_regions if cc not in overviews]
+
+    def build_game_info(self, game_data: Dict, overviews: Dict[str, Dict]) -> Dict:
+        """Собирает информацию об игре из appdetails и цен по регионам"""
+        is_free = game_data.get("is_free", False)
+        status = 'active'
+        post_time = datetime.now().isoformat()
+        start_date = post_time
+        end_date = post_time
+
+        price = self.build_price(overviews, game_data.get('name', ''))
+        # appdetails отдает число, поиск и URL - строку; дальше везде строка
+        app_id = str(game_data.get("steam_appid") or "")
+
         return {
+            "key": steam_game_key(app_id),
             "title": game_data.get("name", ""),
             "publisher": game_data.get("publishers", [""])[0],
             "developers": game_data.get("developers", [""]),
@@ -157,8 +391,8 @@ class SteamParser:
             "is_free": is_free,
             "price": price,
             "image_url": game_data.get("header_image", ""),
-            "url": f"https://store.steampowered.com/app/{game_data.get('steam_appid')}/",
-            "steam_appid": game_data.get("steam_appid", ""),
+            "url": f"https://store.steampowered.com/app/{app_id}/",
+            "steam_appid": app_id,
             "status": status,
             "start_date": start_date,
             "end_date": end_date,
@@ -167,29 +401,353 @@ class SteamParser:
             "genres": [genre.get("description") for genre in game_data.get("genres", [])]
         }
 
+class SteamParser(SteamParserBase):
+    """Синхронный парсер Steam для скриптов"""
+
+    def __init__(self, price_regions: Optional[Dict[str, str]] = None, catalog: Optional[SteamCatalog] = None,
+                 http: Optional[HttpClient] = None):
+        super().__init__(price_regions, catalog)
+        # Общий клиент с пулом соединений, повторами и предохранителем хоста
+        self.http = http or http_client
+
+    def search_games(self, query: str) -> List[Dict]:
+        """Поиск игр в Steam по названию"""
+        if self.is_free_query(query):
+            return self.search_free_games()
+
+        norm_query = normalize_title(query)
+        items = self._cached_search(norm_query)
+        if items is not None:
+            return items
+
+        items, complete = self._search_uncached(query)
+        if not items:
+            try:
+                response = self.http.get(f"{self.base_url}/storesearch/", params=self._search_params(query))
+                response.raise_for_status()
+                items = self._sort_search_items(query, response.json())
+            except Exception as e:
+                print(f"Error searching games: {e}")
+                return []
+        self._cache_search(norm_query, items, complete)
+        return items
+
+    def search_free_games(self) -> List[Dict]:
+        """Поиск бесплатных игр в Steam по ссылке фильтрации"""
+        try:
+            response = self.http.get(self.search_url, params=self._free_games_params())
+            response.raise_for_status()
+            items = self.parse_search_results(response.text)
+            print(f"Found {len(items)} free games")
+            return items
+        except Exception as e:
+            print(f"Error searching free games: {e}")
+            return []
+
+    def get_game_details(self, app_id: str, cc: str = DEFAULT_CC) -> Optional[Dict]:
+        """Получает информацию об игре через Steam API (с кэшированием)"""
+        static, overview = self._cached_details(app_id, cc)
+        if static is NOT_FOUND:
+            return None
+        if static is not MISSING:
+            if overview is MISSING:
+                # Описание еще свежее, обновляем только цену
+                overview = (self.get_price_overviews([app_id], [cc]).get(str(app_id)) or {}).get(cc, MISSING)
+            if overview is not MISSING:
+                return self._with_price(static, overview)
+
+        try:
+            response = self.http.get(f"{self.base_url}/appdetails", params=self._details_params(app_id, cc))
+            response.raise_for_status()
+            data = response.json().get(str(app_id), {}).get("data", {})
+        except Exception as e:
+            print(f"Error getting game details: {e}")
+            return None
+        self._store_details(app_id, cc, data)
+        return data if data else None
+
+    def get_price_overviews(self, app_ids: List[str], regions: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Получает price_overview для многих игр сразу: один запрос на регион и пачку app_id
+
+        Возвращает {app_id: {регион: price_overview}}; для игр, о которых Steam
+        ответил success=false, значение None, а игры из упавших запросов
+        в результат не попадают.
+        """
+        result, batches = self._price_batches(app_ids, regions)
+        for cc, chunk in batches:
+            try:
+                response = self.http.get(f"{self.base_url}/appdetails", params=self._price_params(cc, chunk))
+                response.raise_for_status()
+                data = response.json() or {}
+            except Exception as e:
+                print(f"Error getting prices for {cc}: {e}")
+                continue
+            self._apply_price_batch(result, cc, chunk, data)
+        return result
+
+    def get_prices(self, app_ids: List[str], regions: Optional[List[str]] = None) -> Dict[str, Optional[Dict]]:
+        """Возвращает цены многих игр в формате format_game_info; regions - только эти регионы"""
+        return self._prices_from_overviews(self.get_price_overviews(app_ids, regions))
+
+    def format_game_info(self, game_data: Dict, overviews: Optional[Dict[str, Dict]] = None) -> Dict:
+        """Форматирует информацию об игре в единый формат
+
+        overviews - price_overview по регионам; недостающие регионы
+        запрашиваются одним пакетным запросом.
+        """
+        overviews = dict(overviews or {})
+        missing = self._missing_regions(overviews)
+        if missing:
+            app_id = str(game_data['steam_appid'])
+            overviews.update(self.get_price_overviews([app_id], missing).get(app_id) or {})
+        return self.build_game_info(game_data, overviews)
+
     def get_game_by_url(self, url: str) -> Optional[Dict]:
         """Получает полную информацию об игре по URL"""
         app_id = self.get_app_id_from_url(url)
         if not app_id:
             return None
-            
+
+        return self.get_game_by_id(app_id)
+
+    def get_game_by_id(self, app_id: str) -> Optional[Dict]:
+        """Получает полную информацию об игре по ID"""
         game_data = self.get_game_details(app_id)
         if not game_data:
             return None
-            
-        return self.format_game_info(game_data)
 
-    def get_game_by_id(self, app_id: str) -> Optional[Dict]:
+        # Данные уже запрошены с cc=RU, повторно цену для этого региона не запрашиваем
+        return self.format_game_info(game_data, {DEFAULT_CC: game_data.get("price_overview", {})})
+
+class AsyncSteamParser(SteamParserBase):
+    """Асинхронный парсер Steam, не блокирующий event loop бота
+
+    Все запросы идут через общий AsyncHttpClient (пул соединений, повторы,
+    предохранитель хоста) и ограничены token bucket'ом под квоту Store API.
+    Разбор ответов и кэши общие с SteamParser (SteamParserBase).
+    """
+
+    def __init__(self, price_regions: Optional[Dict[str, str]] = None,
+                 catalog: Optional[SteamCatalog] = None,
+                 rate: float = STORE_RATE, burst: int = STORE_BURST,
+                 async_http: Optional[AsyncHttpClient] = None):
+        super().__init__(price_regions, catalog)
+        self.limiter = TokenBucket(rate, burst)
+        self.async_http = async_http or async_http_client
+        self.catalog_http = AsyncHttpClient(DEFAULT_CONFIG.replace(
+            total_timeout=CATALOG_TIMEOUT, read_timeout=CATALOG_TIMEOUT, retries=CATALOG_RETRIES
+        ))
+        # Одинаковые запросы, пришедшие одновременно, выполняются один раз
+        self._flights = SingleFlight()
+
+    async def close(self):
+        """Закрывает собственную сессию каталога; общий клиент закрывает владелец"""
+        await self.catalog_http.close()
+
+    async def _get_json(self, url: str, params: Dict):
+        return await self.async_http.get_json(url, params=params, limiter=self.limiter)
+
+    async def _get_text(self, url: str, params: Dict) -> str:
+        return await self.async_http.get_text(url, params=params, limiter=self.limiter)
+
+    async def search_games(self, query: str) -> List[Dict]:
+        """Поиск игр в Steam по названию"""
+        if self.is_free_query(query):
+            return await self.search_free_games()
+
+        norm_query = normalize_title(query)
+        items = self._cached_search(norm_query)
+        if items is not None:
+            return items
+        return await self._flights.run(("search", norm_query), self._search_games, query, norm_query)
+
+    async def _search_games(self, query: str, norm_query: str) -> List[Dict]:
+        items, complete = self._search_uncached(query)
+        if not items:
+            try:
+                data = await self._get_json(f"{self.base_url}/storesearch/", self._search_params(query))
+                items = self._sort_search_items(query, data)
+            except Exception as e:
+                print(f"Error searching games: {e}")
+                return []
+        self._cache_search(norm_query, items, complete)
+        return items
+
+    async def refresh_catalog(self, api_key: Optional[str] = None) -> int:
+        """Обновляет локальный каталог приложений, возвращает число изменившихся записей
+
+        С ключом Web API список берется из IStoreService/GetAppList только
+        с изменениями после прошлого обновления, без ключа - полный
+        ISteamApps/GetAppList, из которого в базу пишется только разница.
+        В обоих случаях в каталоге остаются только игры: полный список
+        фильтруется по названию, а уже попавшие в базу не-игры удаляются.
+        """
+        if self.catalog is None:
+            return 0
+        started_at = time.time()
+        try:
+            if api_key:
+                changed = await self._refresh_catalog_since(api_key, self.catalog.get_meta('refreshed_at'))
+            else:
+                data = await self.catalog_http.get_json(APP_LIST_URL)
+                apps = [(app['appid'], app['name']) for app in data.get('applist', {}).get('apps', [])]
+                games = [(appid, name) for appid, name in apps if is_probably_game(name)]
+                others = [appid for appid, name in apps if name and not is_probably_game(name)]
+                changed = await asyncio.to_thread(self.catalog.upsert, games)
+                changed += await asyncio.to_thread(self.catalog.remove, others)
+        except Exception as e:
+            print(f"Error refreshing Steam catalog: {e}")
+            return 0
+        self.catalog.set_meta('refreshed_at', started_at)
+        print(f"Steam catalog refreshed: {changed} changed apps")
+        return changed
+
+    async def _refresh_catalog_since(self, api_key: str, since: Optional[str]) -> int:
+        params = {
+            'key': api_key,
+            'include_games': 1,
+            'max_results': STORE_APP_LIST_PAGE,
+            'last_appid': 0
+        }
+        if since:
+            params['if_modified_since'] = int(float(since))
+        changed = 0
+        while True:
+            data = (await self.catalog_http.get_json(STORE_APP_LIST_URL, params) or {}).get('response', {})
+            apps = [(app['appid'], app['name']) for app in data.get('apps', [])]
+            changed += await asyncio.to_thread(self.catalog.upsert, apps)
+            if not data.get('have_more_results') or not data.get('last_appid'):
+                return changed
+            params['last_appid'] = data['last_appid']
+
+    async def search_free_games(self) -> List[Dict]:
+        """Поиск бесплатных игр в Steam по ссылке фильтрации"""
+        try:
+            html = await self._get_text(self.search_url, self._free_games_params())
+            items = self.parse_search_results(html)
+            print(f"Found {len(items)} free games")
+            return items
+        except Exception as e:
+            print(f"Error searching free games: {e}")
+            return []
+
+    async def _fetch_specials_page(self, min_discount: int, start: int, count: int) -> Optional[Dict]:
+        try:
+            return await self._get_json(f"{self.search_url}results/", self._specials_params(min_discount, start, count))
+        except Exception as e:
+            print(f"Error scanning Steam specials at {start}: {e}")
+            return None
+
+    async def scan_specials(self, min_discount: int, page_size: int = 50, concurrency: int = 4,
+                            max_pages: int = 200, stop_after: int = 5) -> AsyncIterator[Tuple[int, int, float]]:
+        """Обходит все страницы скидок Steam и отдает (app_id, скидка, цена) со скидкой от min_discount
+
+        Страницы JSON-выдачи infinite scroll запрашиваются окнами по concurrency
+        штук, в памяти одновременно держится только одно окно. Выдача Steam
+        не сортируется по скидке, поэтому обход останавливается после
+        stop_after страниц подряд без подходящих скидок, по концу выдачи
+        или по max_pages.
+        """
+        first = await self._fetch_specials_page(min_discount, 0, page_size)
+        if not first:
+            return
+        total = min(int(first.get('total_count') or 0), max_pages * page_size)
+        pages = [first]
+        next_start = page_size
+        pages_without_hits = 0
+
+        while pages:
+            for page in pages:
+                if page is None:
+                    continue
+                hits = 0
+                for row in self.iter_search_rows(page.get('results_html', '')):
+                    if row['discount'] >= min_discount:
+                        hits += 1
+                        yield row['id'], row['discount'], row['price']
+                pages_without_hits = 0 if hits else pages_without_hits + 1
+            if pages_without_hits >= stop_after or next_start >= total:
+                return
+
+            starts = list(range(next_start, total, page_size))[:concurrency]
+            next_start = starts[-1] + page_size
+            pages = await asyncio.gather(
+                *(self._fetch_specials_page(min_discount, start, page_size) for start in starts)
+            )
+
+    async def get_game_details(self, app_id: str, cc: str = DEFAULT_CC) -> Optional[Dict]:
+        """Получает информацию об игре через Steam API (с кэшированием)"""
+        static, overview = self._cached_details(app_id, cc)
+        if static is NOT_FOUND:
+            return None
+        if static is not MISSING:
+            if overview is MISSING:
+                overviews = await self.get_price_overviews([app_id], [cc])
+                overview = (overviews.get(str(app_id)) or {}).get(cc, MISSING)
+            if overview is not MISSING:
+                return self._with_price(static, overview)
+
+        return await self._flights.run(("details", str(app_id), cc), self._fetch_game_details, app_id, cc)
+
+    async def _fetch_game_details(self, app_id: str, cc: str) -> Optional[Dict]:
+        try:
+            response = await self._get_json(f"{self.base_url}/appdetails", self._details_params(app_id, cc))
+            data = (response or {}).get(str(app_id), {}).get("data", {})
+        except Exception as e:
+            print(f"Error getting game details: {e}")
+            return None
+        self._store_details(app_id, cc, data)
+        return data if data else None
+
+    async def _fetch_price_batch(self, cc: str, chunk: List[str]) -> Optional[Dict]:
+        try:
+            return await self._get_json(f"{self.base_url}/appdetails", self._price_params(cc, chunk)) or {}
+        except Exception as e:
+            print(f"Error getting prices for {cc}: {e}")
+            return None
+
+    async def get_price_overviews(self, app_ids: List[str], regions: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Получает price_overview для многих игр сразу, пачки запрашиваются параллельно"""
+        result, batches = self._price_batches(app_ids, regions)
+        responses = await asyncio.gather(*(self._fetch_price_batch(cc, chunk) for cc, chunk in batches))
+        for (cc, chunk), data in zip(batches, responses):
+            if data is not None:
+                self._apply_price_batch(result, cc, chunk, data)
+        return result
+
+    async def get_prices(self, app_ids: List[str], regions: Optional[List[str]] = None) -> Dict[str, Optional[Dict]]:
+        """Возвращает цены многих игр в формате format_game_info; regions - только эти регионы"""
+        return self._prices_from_overviews(await self.get_price_overviews(app_ids, regions))
+
+    async def format_game_info(self, game_data: Dict, overviews: Optional[Dict[str, Dict]] = None) -> Dict:
+        """Форматирует информацию об игре в единый формат"""
+        overviews = dict(overviews or {})
+        missing = self._missing_regions(overviews)
+        if missing:
+            app_id = str(game_data['steam_appid'])
+            fetched = await self.get_price_overviews([app_id], missing)
+            overviews.update(fetched.get(app_id) or {})
+        return self.build_game_info(game_data, overviews)
+
+    async def get_game_by_url(self, url: str) -> Optional[Dict]:
+        """Получает полную информацию об игре по URL"""
+        app_id = self.get_app_id_from_url(url)
+        if not app_id:
+            return None
+
+        return await self.get_game_by_id(app_id)
+
+    async def get_game_by_id(self, app_id: str) -> Optional[Dict]:
         """Получает полную информацию об игре по ID"""
-        game_data = self.get_game_details(app_id)
+        game_data = await self.get_game_details(app_id)
         if not game_data:
             return None
-            
-        return self.format_game_info(game_data)
+
+        return await self.format_game_info(game_data, {DEFAULT_CC: game_data.get("price_overview", {})})
 
 if __name__ == "__main__":
     parser = SteamParser()
-    
+
     free_games = parser.search_free_games()
     for free_game in free_games:
         print(free_game)
@@ -0,0 +1,177 @@
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from game_keys import normalize_title
+from sqlite_store import SqliteStore
+
+CATALOG_DB = 'data/steam_apps.db'
+APP_LIST_URL = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+STORE_APP_LIST_URL = "https://api.steampowered.com/IStoreService/GetAppList/v1/"
+STORE_APP_LIST_PAGE = 50000
+UPSERT_CHUNK = 500
+# Верхняя граница для диапазонных запросов по префиксу
+PREFIX_END = '\U0010ffff'
+# ISteamApps/GetAppList отдает без типа все приложения: DLC, саундтреки,
+# демо, серверы и видео. Их отсеиваем по названию, как include_games=1
+# в IStoreService/GetAppList. Помечает приложение только слово в конце
+# названия ("Portal 2 Soundtrack", "Game - Demo"): игры вроде "DLC Quest"
+# или "Demo Bash" начинаются с такого слова и остаются в каталоге
+NON_GAME_NAME = re.compile(
+    r'\b(?:soundtracks?|ost|dlc|season pass|dedicated server|sdk|trailers?|teaser|'
+    r'playtest|demo|artbook|art book|wallpapers?|benchmark)\)?\s*$',
+    re.IGNORECASE
+)
+
+
+def is_probably_game(name: str) -> bool:
+    """False для приложений, которые по названию не игры (DLC, саундтрек, демо и т. п.)"""
+    return bool(name) and not NON_GAME_NAME.search(name)
+
+
+class SteamCatalog(SqliteStore):
+    """Локальный каталог приложений Steam: app id -> название
+
+    Хранится в SQLite, поэтому не занимает память бота. Индекс по
+    нормализованному названию работает как префиксное дерево (диапазонный
+    запрос по B-дереву), таблица tokens - инвертированный индекс по словам.
+    """
+
+    def __init__(self, db_path: str = CATALOG_DB):
+        super().__init__(db_path)
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS apps (
+                appid INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                norm TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_apps_norm ON apps(norm);
+            CREATE TABLE IF NOT EXISTS tokens (
+                token TEXT NOT NULL,
+                appid INTEGER NOT NULL,
+                PRIMARY KEY (token, appid)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, str(value))
+            )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM apps LIMIT 1").fetchone() is None
+
+    def needs_refresh(self, max_age: float) -> bool:
+        refreshed_at = self.get_meta('refreshed_at')
+        return refreshed_at is None or time.time() - float(refreshed_at) >= max_age
+
+    def upsert(self, apps: Iterable[Tuple[int, str]]) -> int:
+        """Добавляет новые и переименованные приложения, возвращает число изменений
+
+        Неизменившиеся записи пропускаются, поэтому повторная загрузка полного
+        списка переписывает только разницу.
+        """
+        changed = 0
+        chunk = []
+        for app in apps:
+            chunk.append(app)
+            if len(chunk) >= UPSERT_CHUNK:
+                changed += self._upsert_chunk(chunk)
+                chunk = []
+        if chunk:
+            changed += self._upsert_chunk(chunk)
+        return changed
+
+    def _upsert_chunk(self, chunk: List[Tuple[int, str]]) -> int:
+        apps = {int(appid): name for appid, name in chunk if name}
+        if not apps:
+            return 0
+        with self._lock, self.conn:
+            placeholders = ','.join('?' for _ in apps)
+            existing = dict(self.conn.execute(
+                f"SELECT appid, name FROM apps WHERE appid IN ({placeholders})", list(apps)
+            ).fetchall())
+            changed = [(appid, name) for appid, name in apps.items() if existing.get(appid) != name]
+            if not changed:
+                return 0
+            self.conn.executemany(
+                "DELETE FROM tokens WHERE appid = ?",
+                [(appid,) for appid, _ in changed if appid in existing]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO apps (appid, name, norm) VALUES (?, ?, ?)",
+                [(appid, name, normalize_title(name)) for appid, name in changed]
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tokens (token, appid) VALUES (?, ?)",
+                [(token, appid) for appid, name in changed for token in set(normalize_title(name).split())]
+            )
+        return len(changed)
+
+    def remove(self, appids: Iterable[int]) -> int:
+        """Удаляет приложения из каталога, возвращает число удаленных"""
+        removed = 0
+        appids = [(int(appid),) for appid in appids]
+        for start in range(0, len(appids), UPSERT_CHUNK):
+            chunk = appids[start:start + UPSERT_CHUNK]
+            with self._lock, self.conn:
+                self.conn.executemany("DELETE FROM tokens WHERE appid = ?", chunk)
+                removed += self.conn.executemany("DELETE FROM apps WHERE appid = ?", chunk).rowcount
+        return removed
+
+    def search(self, query: str, limit: int = 100) -> List[Dict]:
+        """Ищет приложения по названию: сначала совпадения по началу названия, затем по словам
+
+        Последнее слово запроса может быть недописанным. Внутри каждой группы
+        ближе к запросу - более короткие названия, поэтому точное совпадение
+        идет первым.
+        """
+        norm = normalize_title(query)
+        if not norm:
+            return []
+        words = norm.split()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT appid, name FROM apps WHERE norm >= ? AND norm < ? ORDER BY length(norm), norm LIMIT ?",
+                (norm, norm + PREFIX_END, limit)
+            ).fetchall()
+            if len(rows) < limit:
+                subqueries = ["SELECT appid FROM tokens WHERE token = ?" for _ in words[:-1]]
+                subqueries.append("SELECT appid FROM tokens WHERE token >= ? AND token < ?")
+                params = words[:-1] + [words[-1], words[-1] + PREFIX_END]
+                rows += self.conn.execute(
+                    f"SELECT appid, name FROM apps WHERE appid IN ({' INTERSECT '.join(subqueries)}) "
+                    f"ORDER BY length(norm), norm LIMIT ?",
+                    params + [limit * 2]
+                ).fetchall()
+
+        items = []
+        seen = set()
+        for appid, name in rows:
+            if appid in seen:
+                continue
+            seen.add(appid)
+            items.append({'id': appid, 'name': name})
+            if len(items) >= limit:
+                break
+        return items
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM apps").fetchone()[0]
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+from typing import Optional
+
+from sqlite_store import SqliteStore
+
+PHOTO_CACHE_DB = 'data/photo_cache.db'
+
+
+class PhotoCache(SqliteStore):
+    """Постоянный кэш URL картинки -> file_id в Telegram
+
+    После первой отправки картинка уже лежит на серверах Telegram, и
+    повторные отправки по file_id не заставляют его скачивать ее заново.
+    """
+
+    def __init__(self, db_path: str = PHOTO_CACHE_DB):
+        super().__init__(db_path)
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS photos (
+                url TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def get(self, url: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT file_id FROM photos WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, url: str, file_id: str):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO photos (url, file_id, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET file_id = excluded.file_id, updated_at = excluded.updated_at",
+                (url, file_id, time.time())
+            )
+
+    def discard(self, url: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM photos WHERE url = ?", (url,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM photos").fetchone()[0]
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional
+
+QUEUE_SIZE = 100
+# Сколько пакетная стадия ждет, пока соберется пачка
+BATCH_LINGER = 0.5
+
+
+class StageStats:
+    """Счетчики стадии: обработано, отброшено, ошибки, задержка и глубина очереди"""
+
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.max_depth = 0
+
+    def record(self, elapsed: float):
+        self.processed += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def as_dict(self) -> Dict[str, Any]:
+        avg = self.total_time / self.processed if self.processed else 0.0
+        return {
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'avg_ms': round(avg * 1000, 1),
+            'max_ms': round(self.max_time * 1000, 1),
+            'max_depth': self.max_depth,
+        }
+
+
+class Stage:
+    """Стадия конвейера: func(item) -> новый item или None, чтобы отбросить его
+
+    Если batch_size больше 1, func получает список до batch_size элементов,
+    собранных за BATCH_LINGER секунд после первого. Если ordered, результаты
+    нескольких воркеров передаются дальше в порядке входа, а не завершения.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Awaitable], workers: int = 1, batch_size: int = 1,
+                 ordered: bool = False):
+        if ordered and batch_size > 1:
+            raise ValueError("Упорядоченная стадия не может быть пакетной")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.stats = StageStats()
+        # Входная очередь стадии; max_depth в stats - ее наибольшая глубина
+        self.queue: Optional[asyncio.Queue] = None
+        self._next_in = 0
+        self._next_out = 0
+        self._reorder: Dict[int, Any] = {}
+        self._release_lock = asyncio.Lock()
+
+    def reset(self, queue_size: int):
+        self.queue = asyncio.Queue(queue_size)
+        self._next_in = 0
+        self._next_out = 0
+        self._reorder = {}
+
+    async def put(self, item):
+        await self.queue.put(item)
+        self.stats.max_depth = max(self.stats.max_depth, self.queue.qsize())
+
+
+class Pipeline:
+    """Конвейер из стадий, связанных ограниченными asyncio.Queue
+
+    Стадии работают одновременно, у каждой свое число воркеров. Когда
+    очередь следующей стадии заполнена, предыдущая ждет (backpressure).
+    После прогона stats() показывает, где копятся элементы и что медленнее.
+    Ошибка в стадии не останавливает остальные элементы, но первая из них
+    поднимается из run(), когда очереди опустеют.
+    """
+
+    def __init__(self, name: str, stages: List[Stage], queue_size: int = QUEUE_SIZE):
+        self.name = name
+        self.stages = stages
+        self.queue_size = queue_size
+        self.fetch_stats = StageStats()
+        self._error: Optional[BaseException] = None
+
+    async def _take(self, stage: Stage) -> list:
+        queue = stage.queue
+        items = [await queue.get()]
+        if stage.batch_size > 1:
+            deadline = time.monotonic() + BATCH_LINGER
+            while len(items) < stage.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        return items
+
+    async def _forward(self, next_stage: Optional[Stage], result):
+        if result is None:
+            return
+        if next_stage is not None:
+            await next_stage.put(result)
+
+    async def _release(self, stage: Stage, next_stage: Optional[Stage], seq: int, result):
+        """Передает дальше результаты упорядоченной стадии, начиная с самого раннего"""
+        stage._reorder[seq] = result
+        async with stage._release_lock:
+            while stage._next_out in stage._reorder:
+                await self._forward(next_stage, stage._reorder.pop(stage._next_out))
+                stage._next_out += 1
+
+    async def _worker(self, stage: Stage, next_stage: Optional[Stage]):
+        while True:
+            items = await self._take(stage)
+            # Между get() и этой строкой нет await, поэтому номер совпадает с порядком в очереди
+            seq = stage._next_in
+            stage._next_in += 1
+            result = None
+            try:
+                started = time.monotonic()
+                result = await stage.func(items if stage.batch_size > 1 else items[0])
+                stage.stats.record(time.monotonic() - started)
+                if result is None:
+                    stage.stats.dropped += 1
+                elif not stage.ordered:
+                    await self._forward(next_stage, result)
+            except Exception as e:
+                result = None
+                stage.stats.errors += 1
+                logging.error(f"Ошибка на стадии {self.name}/{stage.name}: {e}")
+                if self._error is None:
+                    self._error = e
+            finally:
+                try:
+                    if stage.ordered:
+                        await self._release(stage, next_stage, seq, result)
+                finally:
+                    for _ in items:
+                        stage.queue.task_done()
+
+    async def run(self, source: AsyncIterable):
+        """Прогоняет все элементы source через стадии и ждет, пока они закончатся
+
+        Поднимает первую ошибку стадий, если она была.
+        """
+        self._error = None
+        for stage in self.stages:
+            stage.reset(self.queue_size)
+        workers = []
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            workers += [
+                asyncio.create_task(self._worker(stage, next_stage))
+                for _ in range(stage.workers)
+            ]
+        try:
+            started = time.monotonic()
+            async for item in source:
+                self.fetch_stats.record(time.monotonic() - started)
+                await self.stages[0].put(item)
+                started = time.monotonic()
+            # Стадии завершаются по порядку: элементы попадают в очередь
+            # следующей стадии раньше, чем отмечаются выполненными в текущей
+            for stage in self.stages:
+                await stage.queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if self._error is not None:
+            raise self._error
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики по стадиям; fetch - источник, max_depth - наибольшая глубина входной очереди стадии"""
+        result = {'fetch': self.fetch_stats.as_dict()}
+        for stage in self.stages:
+            result[stage.name] = stage.stats.as_dict()
+        return result
@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+POLLER_STATE = 'data/poller_state.json'
+DAY = 24 * 3600
+WEEK = 7 * DAY
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+# Сколько последних изменений помнить для оценки типичного времени обновления
+LEARN_SIZE = 8
+# Сколько наблюдений нужно, чтобы им доверять больше, чем настройкам
+LEARN_MIN = 3
+
+
+def parse_rollover(spec: Optional[str]) -> Tuple[int, Optional[int]]:
+    """Разбирает время обновления магазина: 'thu 15:00' (раз в неделю) или '17:00' (каждый день), UTC
+
+    Возвращает (период в секундах, смещение внутри периода или None).
+    """
+    if not spec or not spec.strip():
+        return WEEK, None
+    parts = spec.strip().lower().split()
+    hours, minutes = (int(value) for value in parts[-1].split(':'))
+    offset = hours * 3600 + minutes * 60
+    if len(parts) == 1:
+        return DAY, offset
+    return WEEK, WEEKDAYS.index(parts[0][:3]) * DAY + offset
+
+
+def period_offset(timestamp: float, period: int) -> float:
+    """Положение момента внутри дня или недели (недели - с понедельника)"""
+    if period == WEEK:
+        # 1970-01-01 был четвергом
+        return (timestamp + 3 * DAY) % WEEK
+    return timestamp % period
+
+
+def circular_distance(a: float, b: float, period: int) -> float:
+    """Расстояние между моментами внутри периода с учетом перехода через его границу"""
+    diff = abs(a - b) % period
+    return min(diff, period - diff)
+
+
+def circular_median(values: List[float], period: int) -> float:
+    """Медиана моментов на окружности периода: наблюдение с наименьшей суммой расстояний до остальных
+
+    Обычная медиана для 23:55 и 00:05 дала бы середину суток, эта - одно из них.
+    """
+    return min(values, key=lambda candidate: sum(circular_distance(candidate, v, period) for v in values))
+
+
+class AdaptivePoller:
+    """Подбирает паузу до следующей проверки источника
+
+    Внутри окон - около типичного времени обновления магазина и около
+    ближайших дат начала и конца раздач - проверки идут с min_interval.
+    Вне окон пауза растет в backoff раз после каждой проверки без изменений
+    (до max_interval) и сбрасывается, когда данные изменились. Время
+    обновления уточняется по моментам, когда изменения действительно
+    случались, и сохраняется между перезапусками.
+    """
+
+    def __init__(self, name: str, min_interval: float, max_interval: float, backoff: float = 2.0,
+                 window: float = 900, rollover: Optional[str] = None, state_file: str = POLLER_STATE):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.window = window
+        self.period, self.default_rollover = parse_rollover(rollover)
+        self.state_file = state_file
+        self.interval = min_interval
+        self._fingerprint = None
+        self._events: List[float] = []
+        self._changes: List[float] = self._load_changes()
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ошибка при чтении состояния опроса: {e}")
+            return {}
+
+    def _load_changes(self) -> List[float]:
+        return list(self._load_state().get(self.name, {}).get('changes', []))
+
+    def _save_changes(self):
+        state = self._load_state()
+        state[self.name] = {'changes': self._changes}
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    @property
+    def rollover(self) -> Optional[float]:
+        """Типичное время обновления внутри периода: медиана наблюдений или значение из настроек"""
+        if len(self._changes) >= LEARN_MIN or (self._changes and self.default_rollover is None):
+            return circular_median(self._changes, self.period)
+        return self.default_rollover
+
+    def observe(self, fingerprint, events: Iterable[datetime] = (), now: Optional[float] = None):
+        """Учитывает результат проверки: отпечаток данных и известные даты событий"""
+        now = time.time() if now is None else now
+        self._events = sorted(event.timestamp() for event in events if event)
+        if self._fingerprint is not None and fingerprint != self._fingerprint:
+            self.interval = self.min_interval
+            self._changes = (self._changes + [period_offset(now, self.period)])[-LEARN_SIZE:]
+            try:
+                self._save_changes()
+            except OSError as e:
+                print(f"Ошибка при сохранении состояния опроса: {e}")
+        elif self._fingerprint is not None:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        self._fingerprint = fingerprint
+
+    def _window_starts(self, now: float) -> List[float]:
+        """Ближайшие моменты начала окон частого опроса"""
+        starts = [event - self.window for event in self._events if event + self.window >= now]
+        rollover = self.rollover
+        if rollover is not None:
+            period_start = now - period_offset(now, self.period)
+            for base in (period_start - self.period, period_start, period_start + self.period):
+                if base + rollover + self.window >= now:
+                    starts.append(base + rollover - self.window)
+        return starts
+
+    def in_window(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return any(start <= now for start in self._window_starts(now))
+
+    def next_delay(self, now: Optional[float] = None) -> float:
+        """Пауза в секундах до следующей проверки"""
+        now = time.time() if now is None else now
+        if self.in_window(now):
+            return self.min_interval
+        upcoming = [start - now for start in self._window_starts(now) if start > now]
+        delay = self.interval
+        if upcoming:
+            # Просыпаемся к началу ближайшего окна, даже если пауза уже выросла
+            delay = min(delay, min(upcoming))
+        return max(delay, self.min_interval)
@@ -1,43 +1,489 @@
+import configparser
+import hashlib
 import json
-from datetime import datetime, timezone
 import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from typing import Optional
 
+from game_keys import game_key, normalize_title, title_game_key
+from sqlite_store import SqliteStore
+
+config = configparser.ConfigParser()
+config.read("settings.cfg", encoding="utf-8")
+
+HISTORY_BACKEND = config.get("history", "backend", fallback="sqlite")
+JOURNAL_COMPACT_THRESHOLD = config.getint("history", "compact_threshold", fallback=500)
+
+# Старый JSON-файл истории, который переносится в выбранный бэкенд
 HISTORY_FILE = 'data/post_history.json'
+JOURNAL_SNAPSHOT = 'data/post_history.snapshot.json'
+HISTORY_JOURNAL = 'data/post_history.journal.jsonl'
+HISTORY_DB = 'data/post_history.db'
+
+HISTORY_FIELDS = (
+    'key', 'title', 'status', 'post_time', 'post_type', 'chat_id',
+    'message_id', 'start_date', 'end_date', 'steam_appid', 'fingerprint',
+)
+
+
+def post_fingerprint(game_info: dict) -> str:
+    """Отпечаток содержимого поста: статус, даты и цены
+
+    Если отпечаток не изменился, опубликованный пост править не нужно.
+    """
+    content = {
+        'status': game_info.get('status'),
+        'start_date': game_info.get('start_date'),
+        'end_date': game_info.get('end_date'),
+        'price': game_info.get('price'),
+    }
+    data = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+def with_key(entry: dict) -> dict:
+    """Дополняет запись истории ключом игры, если его нет (старые записи)"""
+    if not entry.get('key'):
+        entry = dict(entry, key=game_key(entry))
+    return entry
+
+
+def retire_file(path: str):
+    """Переименовывает перенесенный файл истории в *.migrated вместе с файлами WAL SQLite"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.replace(path + suffix, path + '.migrated' + suffix)
+
+
+class SqliteHistory(SqliteStore):
+    """История постов в SQLite (WAL) с индексами по ключу игры, названию, steam_appid и end_date"""
+
+    def __init__(self, db_path: str = HISTORY_DB, legacy_file: Optional[str] = HISTORY_FILE,
+                 journal_snapshot: Optional[str] = JOURNAL_SNAPSHOT, journal_file: Optional[str] = HISTORY_JOURNAL):
+        super().__init__(db_path)
+        self.legacy_file = legacy_file
+        self.journal_snapshot = journal_snapshot
+        self.journal_file = journal_file
+        self._batch_depth = 0
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.row_factory = sqlite3.Row
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT,
+                title TEXT NOT NULL,
+                title_norm TEXT NOT NULL,
+                status TEXT,
+                post_time TEXT,
+                post_type TEXT,
+                chat_id INTEGER,
+                message_id INTEGER,
+                start_date TEXT,
+                end_date TEXT,
+                steam_appid TEXT,
+                fingerprint TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_posts_title_norm ON posts(title_norm);
+            CREATE INDEX IF NOT EXISTS idx_posts_steam_appid ON posts(steam_appid);
+            CREATE INDEX IF NOT EXISTS idx_posts_end_date ON posts(end_date);
+        """)
+        self._migrate_keys(conn)
+        self._migrate_fingerprints(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_key ON posts(key)")
+        self._migrate_files(conn)
+
+    def _migrate_keys(self, conn: sqlite3.Connection):
+        """Добавляет ключи игр в базу, созданную до их появления"""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(posts)")}
+        if 'key' in columns:
+            return
+        rows = conn.execute("SELECT id, title, steam_appid FROM posts").fetchall()
+        with conn:
+            conn.execute("ALTER TABLE posts ADD COLUMN key TEXT")
+            conn.executemany(
+                "UPDATE posts SET key = ?, title_norm = ? WHERE id = ?",
+                [(game_key(dict(row)), normalize_title(row['title']), row['id']) for row in rows],
+            )
+
+    def _migrate_fingerprints(self, conn: sqlite3.Connection):
+        """Добавляет колонку отпечатка в базу, созданную до ее появления"""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(posts)")}
+        if 'fingerprint' not in columns:
+            with conn:
+                conn.execute("ALTER TABLE posts ADD COLUMN fingerprint TEXT")
+
+    def _migrate_files(self, conn: sqlite3.Connection):
+        """Однократно переносит записи из старого JSON-файла и из журнального бэкенда"""
+        sources = [path for path in (self.legacy_file, self.journal_snapshot, self.journal_file)
+                   if path and os.path.exists(path)]
+        if not sources:
+            return
+        # Журнал проигрывается поверх своего снимка (или старого JSON-файла), как при его загрузке
+        journal = JournalHistory(self.journal_snapshot or '', self.journal_file or '',
+                                 legacy_file=self.legacy_file, db_path=None)
+        journal._read()
+        entries = journal._entries
+        with conn:
+            conn.executemany(self._insert_sql(), [self._row(e) for e in entries])
+        for path in sources:
+            retire_file(path)
+        print(f"История перенесена в SQLite: {len(entries)} записей")
+
+    @staticmethod
+    def _insert_sql() -> str:
+        columns = ', '.join(HISTORY_FIELDS + ('title_norm',))
+        placeholders = ', '.join('?' for _ in HISTORY_FIELDS + ('title_norm',))
+        return f"INSERT INTO posts ({columns}) VALUES ({placeholders})"
+
+    @staticmethod
+    def _row(entry: dict) -> tuple:
+        entry = with_key(entry)
+        values = [entry.get(field) for field in HISTORY_FIELDS]
+        steam_appid = entry.get('steam_appid')
+        values[HISTORY_FIELDS.index('steam_appid')] = str(steam_appid) if steam_appid else None
+        return tuple(values) + (normalize_title(entry.get('title')),)
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> dict:
+        entry = {field: row[field] for field in HISTORY_FIELDS}
+        if not entry['steam_appid']:
+            del entry['steam_appid']
+        return entry
+
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            if self._batch_depth:
+                yield self.conn
+            else:
+                with self.conn:
+                    yield self.conn
+
+    @contextmanager
+    def batch(self):
+        """Объединяет несколько изменений в одну транзакцию; при ошибке откатывает ее"""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield
+            except BaseException:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self.conn.rollback()
+                raise
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.conn.commit()
+
+    def compact(self):
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def all(self) -> list:
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {', '.join(HISTORY_FIELDS)} FROM posts ORDER BY id").fetchall()
+        return [self._entry(row) for row in rows]
+
+    def replace_all(self, entries: list):
+        with self._write() as conn:
+            conn.execute("DELETE FROM posts")
+            conn.executemany(self._insert_sql(), [self._row(e) for e in entries])
+
+    def add(self, entry: dict):
+        with self._write() as conn:
+            conn.execute(self._insert_sql(), self._row(entry))
+
+    def contains_key(self, key: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM posts WHERE key = ? LIMIT 1", (key,)).fetchone()
+        return row is not None
+
+    def get_key(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(HISTORY_FIELDS)} FROM posts WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def remove_key(self, key: str):
+        with self._write() as conn:
+            conn.execute("DELETE FROM posts WHERE key = ?", (key,))
+
+    def update_key(self, key: str, changes: dict):
+        fields = [field for field in changes if field in HISTORY_FIELDS and field != 'key']
+        if not fields:
+            return
+        with self._write() as conn:
+            conn.execute(
+                f"UPDATE posts SET {', '.join(f'{field} = ?' for field in fields)} WHERE key = ?",
+                [changes[field] for field in fields] + [key],
+            )
+
+
+class JournalHistory:
+    """История постов в памяти: JSON-снимок плюс append-only журнал изменений
+
+    Записи индексируются по ключу игры, все чтения обслуживаются из памяти, изменения дописываются в журнал
+    (fsync один раз на пачку), а compact() сворачивает журнал в снимок. Если снимка еще нет, история
+    один раз переносится из старого JSON-файла или из базы SQLite.
+    """
+
+    def __init__(self, snapshot_file: str = JOURNAL_SNAPSHOT, journal_file: str = HISTORY_JOURNAL,
+                 compact_threshold: int = JOURNAL_COMPACT_THRESHOLD, legacy_file: Optional[str] = HISTORY_FILE,
+                 db_path: Optional[str] = HISTORY_DB):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.legacy_file = legacy_file
+        self.db_path = db_path
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._entries = None
+        self._index = {}
+        self._pending = []
+        self._journal_size = 0
+        self._batch_depth = 0
+
+    def _ensure_loaded(self):
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._load()
+
+    def _load(self):
+        source = self._read()
+        if source is not None:
+            # Перенесенная история сразу сохраняется в свой снимок, источник больше не читается
+            self._flush_snapshot()
+            retire_file(source)
+            print(f"История перенесена в журнал: {len(self._entries)} записей")
+
+    def _read_base(self) -> tuple:
+        """Записи снимка и файл, из которого их нужно перенести (None для своего снимка)"""
+        if os.path.exists(self.snapshot_file):
+            return self._read_json(self.snapshot_file), None
+        if self.legacy_file and os.path.exists(self.legacy_file):
+            # Старый JSON-файл - он же снимок журнала до появления JOURNAL_SNAPSHOT
+            return self._read_json(self.legacy_file), self.legacy_file
+        if self.db_path and os.path.exists(self.db_path):
+            store = SqliteHistory(self.db_path, legacy_file=None, journal_snapshot=None, journal_file=None)
+            try:
+                return store.all(), self.db_path
+            finally:
+                store.close()
+        return [], None
+
+    @staticmethod
+    def _read_json(path: str) -> list:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ошибка при чтении снимка истории: {e}")
+            return []
+
+    def _read(self) -> Optional[str]:
+        """Загружает снимок и проигрывает журнал; возвращает файл, из которого перенесена история"""
+        entries, source = self._read_base()
+        self._entries = []
+        self._index = {}
+        for entry in entries:
+            if isinstance(entry, dict):
+                self._apply_add(entry)
+        self._journal_size = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Недописанная строка после аварийного завершения
+                        continue
+                    self._apply(record)
+                    self._journal_size += 1
+        return source
+
+    def _apply(self, record: dict):
+        if record.get('op') == 'add':
+            self._apply_add(record['entry'])
+        elif record.get('op') == 'remove':
+            self._apply_remove(record['key'])
+        elif record.get('op') == 'update':
+            self._apply_update(record['key'], record['changes'])
+
+    def _apply_add(self, entry: dict):
+        entry = with_key(entry)
+        self._entries.append(entry)
+        self._index[entry['key']] = self._index.get(entry['key'], 0) + 1
+
+    def _apply_remove(self, key: str):
+        if self._index.pop(key, None):
+            self._entries = [e for e in self._entries if e['key'] != key]
+
+    def _apply_update(self, key: str, changes: dict):
+        if key in self._index:
+            for entry in self._entries:
+                if entry['key'] == key:
+                    entry.update(changes)
+
+    def _log(self, record: dict):
+        self._apply(record)
+        self._pending.append(json.dumps(record, ensure_ascii=False))
+        if not self._batch_depth:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        os.makedirs(os.path.dirname(self.journal_file) or '.', exist_ok=True)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(self._pending) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_size += len(self._pending)
+        self._pending = []
+        if self._journal_size >= self.compact_threshold:
+            self.compact()
+
+    @contextmanager
+    def batch(self):
+        """Откладывает запись журнала до конца пачки изменений; при ошибке пачка отбрасывается"""
+        self._ensure_loaded()
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield
+            except BaseException:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    # Изменения уже применены в памяти, возвращаемся к записанному на диск
+                    self._pending = []
+                    self._load()
+                raise
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._flush()
+
+    def compact(self):
+        """Сворачивает журнал в снимок"""
+        self._ensure_loaded()
+        with self._lock:
+            if self._batch_depth:
+                return
+            self._flush_snapshot()
+
+    def _flush_snapshot(self):
+        os.makedirs(os.path.dirname(self.snapshot_file) or '.', exist_ok=True)
+        tmp_file = self.snapshot_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        open(self.journal_file, 'w', encoding='utf-8').close()
+        self._journal_size = 0
+
+    def all(self) -> list:
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(e) for e in self._entries]
+
+    def replace_all(self, entries: list):
+        self._ensure_loaded()
+        with self._lock:
+            self._entries = []
+            self._index = {}
+            for entry in entries:
+                self._apply_add(entry)
+            self._pending = []
+            self._flush_snapshot()
+
+    def add(self, entry: dict):
+        self._ensure_loaded()
+        with self._lock:
+            self._log({'op': 'add', 'entry': with_key(entry)})
+
+    def contains_key(self, key: str) -> bool:
+        self._ensure_loaded()
+        return key in self._index
+
+    def get_key(self, key: str) -> Optional[dict]:
+        self._ensure_loaded()
+        with self._lock:
+            if key not in self._index:
+                return None
+            for entry in reversed(self._entries):
+                if entry['key'] == key:
+                    return dict(entry)
+        return None
+
+    def remove_key(self, key: str):
+        self._ensure_loaded()
+        with self._lock:
+            if key in self._index:
+                self._log({'op': 'remove', 'key': key})
+
+    def update_key(self, key: str, changes: dict):
+        self._ensure_loaded()
+        changes = {field: value for field, value in changes.items() if field in HISTORY_FIELDS and field != 'key'}
+        with self._lock:
+            if key in self._index and changes:
+                self._log({'op': 'update', 'key': key, 'changes': changes})
+
+
+def create_store(backend: str = HISTORY_BACKEND):
+    """Создает хранилище истории по имени бэкенда из settings.cfg"""
+    if backend == 'journal':
+        return JournalHistory()
+    if backend == 'sqlite':
+        return SqliteHistory()
+    raise ValueError("Неизвестный бэкенд истории: " + backend)
+
+
+_store = create_store()
+
+
+@contextmanager
+def history_batch():
+    """Группирует изменения истории: одна транзакция или один fsync журнала
+
+    Пачка держит блокировку истории, поэтому внутри нее не должно быть
+    await: сначала выполняются запросы, затем изменения применяются разом.
+    """
+    with _store.batch():
+        yield
+
+
+def compact_history():
+    """Сворачивает накопленные изменения истории в основное хранилище"""
+    try:
+        _store.compact()
+    except Exception as e:
+        print(f"Ошибка при сжатии истории: {e}")
 
-def ensure_history_file():
-    """Создает файл истории, если он не существует"""
-    os.makedirs('data', exist_ok=True)
-    if not os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
 
 def load_history():
     """Загружает историю постов"""
-    ensure_history_file()
-    try:
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-        return []
+    return _store.all()
+
 
 def save_history(history):
     """Сохраняет историю постов"""
-    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
+    _store.replace_all(history)
+
 
 def add_to_history(game_info: dict, post_type: str = 'auto', chat_id: Optional[int] = None, message_id: Optional[int] = None):
     """Добавляет пост в историю"""
-    history = load_history()
     now = datetime.now(timezone.utc).isoformat()
     title = game_info.get('title') or ''
     status = game_info.get('status') or 'active'
     start_date = game_info.get('start_date') or now
     end_date = game_info.get('end_date') or now
     entry = {
+        'key': game_key(game_info),
         'title': title,
         'status': status,
         'post_time': now,
@@ -45,31 +491,47 @@ def add_to_history(game_info: dict, post_type: str = 'auto', chat_id: Optional[i
         'chat_id': chat_id,
         'message_id': message_id,
         'start_date': start_date,
-        'end_date': end_date
+        'end_date': end_date,
+        'fingerprint': post_fingerprint(game_info)
     }
     # Добавляем идентификатор Steam, если это Steam игра
     if game_info.get('steam_appid'):
-        entry['steam_appid'] = game_info['steam_appid']
-    save_history(history + [entry])
+        entry['steam_appid'] = str(game_info['steam_appid'])
+    _store.add(entry)
 
-def is_game_posted(game_title: str) -> bool:
+def is_game_posted(game_info: dict) -> bool:
     """Проверяет, был ли уже пост об этой игре"""
     try:
-        history = load_history()
-        return any(post['title'].lower() == game_title.lower() for post in history)
+        if _store.contains_key(game_key(game_info)):
+            return True
+        # Записи, сделанные до появления ключей, находятся только по названию
+        return _store.contains_key(title_game_key(game_info.get('title')))
     except Exception as e:
         print(f"Ошибка при проверке истории: {e}")
         return False
 
-def remove_from_history(game_title: str):
-    """Удаляет игру из истории"""
+def remove_from_history(key: str):
+    """Удаляет игру из истории по ключу"""
     try:
-        history = load_history()
-        history = [post for post in history if post['title'].lower() != game_title.lower()]
-        save_history(history)
+        _store.remove_key(key)
     except Exception as e:
         print(f"Ошибка при удалении из истории: {e}")
 
+def get_history_entry(key: str) -> Optional[dict]:
+    """Возвращает последнюю запись истории по ключу игры или None"""
+    try:
+        return _store.get_key(key)
+    except Exception as e:
+        print(f"Ошибка при чтении истории: {e}")
+        return None
+
+def update_history(key: str, **changes):
+    """Обновляет поля записи истории по ключу игры (например, после правки поста)"""
+    try:
+        _store.update_key(key, changes)
+    except Exception as e:
+        print(f"Ошибка при обновлении истории: {e}")
+
 def get_posted_games() -> list:
     """Возвращает список всех опубликованных игр"""
     try:
@@ -77,4 +539,4 @@ def get_posted_games() -> list:
         return history
     except Exception as e:
         print(f"Ошибка при получении истории: {e}")
-        return []
\ No newline at end of file
+        return []
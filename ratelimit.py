@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Асинхронный token bucket: rate токенов в секунду, не больше capacity сразу"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Забирает токены без ожидания; если их мало - возвращает, сколько секунд ждать
+
+        Больше capacity токенов сразу не накопится, поэтому такой запрос
+        ждет полного ведра и уводит его в минус: следующие ждут дольше.
+        """
+        self._refill()
+        need = min(tokens, self.capacity)
+        if self._tokens >= need:
+            self._tokens -= tokens
+            return 0.0
+        return (need - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1):
+        """Ждет, пока в ведре наберется нужное число токенов, и забирает их"""
+        async with self._lock:
+            while True:
+                delay = self.reserve(tokens)
+                if not delay:
+                    return
+                await asyncio.sleep(delay)
+
+    def penalize(self, seconds: float):
+        """Откладывает выдачу токенов на seconds секунд, например после flood wait"""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
@@ -0,0 +1,76 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+
+# Дольше не спим даже без событий: часы могли сдвинуться, а компьютер - уснуть
+MAX_SLEEP = 300
+
+
+class DeadlineScheduler:
+    """Таймеры на известные моменты времени (начало и конец раздач) на куче
+
+    Для каждой пары (key, kind) действует только последний заданный срок:
+    перенос или отмена не ищут запись в куче, а помечают старую устаревшей.
+    Ближайший срок берется за O(log n), поэтому переход срабатывает через
+    секунды после наступления и затрагивает только свою запись.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable, str]] = []
+        self._current: Dict[Tuple[Hashable, str], int] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, key: Hashable, kind: str, when: float):
+        """Назначает (или переносит) событие kind для key на момент when (unix time)"""
+        seq = next(self._counter)
+        self._current[(key, kind)] = seq
+        heapq.heappush(self._heap, (when, seq, key, kind))
+        # Новый срок может оказаться раньше того, до которого спит run()
+        self._wakeup.set()
+
+    def cancel(self, key: Hashable, kind: str = None):
+        """Отменяет события для key: одно, если задан kind, иначе все"""
+        for current in [item for item in self._current if item[0] == key and kind in (None, item[1])]:
+            del self._current[current]
+
+    def clear(self):
+        self._heap = []
+        self._current = {}
+
+    def _pop_due(self, now: float) -> List[Tuple[Hashable, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key, kind = heapq.heappop(self._heap)
+            if self._current.get((key, kind)) == seq:
+                del self._current[(key, kind)]
+                due.append((key, kind))
+        return due
+
+    def _next_deadline(self) -> float:
+        # Устаревшие записи на вершине кучи выбрасываем сразу
+        while self._heap and self._current.get((self._heap[0][2], self._heap[0][3])) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else float('inf')
+
+    async def run(self, handler: Callable[[Hashable, str], Awaitable]):
+        """Вызывает handler(key, kind) для наступивших событий, пока задача не отменена"""
+        while True:
+            for key, kind in self._pop_due(time.time()):
+                try:
+                    await handler(key, kind)
+                except Exception as e:
+                    logging.error(f"Ошибка в обработчике события {kind} для {key}: {e}")
+
+            delay = min(max(self._next_deadline() - time.time(), 0), MAX_SLEEP)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._current)
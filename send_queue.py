@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Dict, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from photo_cache import PhotoCache
+from ratelimit import TokenBucket
+
+# Приоритеты: меньше - раньше. Предпросмотры для админа не ждут постов в канал
+PRIORITY_PREVIEW = 0
+PRIORITY_CHANNEL = 1
+
+# Лимиты Bot API: около 30 сообщений в секунду всего,
+# 1 в секунду в личный чат и 20 в минуту в группу или канал
+GLOBAL_RATE = 30
+PRIVATE_RATE = 1
+GROUP_RATE = 20 / 60
+GROUP_BURST = 3
+MAX_RETRIES = 3
+# Больше 10 картинок в одном альбоме Telegram не принимает
+MEDIA_GROUP_SIZE = 10
+# Ошибки Telegram, после которых file_id из кэша больше не годится
+FILE_ID_ERRORS = (
+    'wrong file identifier',
+    'wrong remote file identifier',
+    'file reference expired',
+    'file_reference_expired',
+)
+
+
+def is_file_id_error(error: TelegramBadRequest) -> bool:
+    message = str(error).lower()
+    return any(text in message for text in FILE_ID_ERRORS)
+
+
+class SendQueue:
+    """Общая очередь исходящих запросов к Telegram
+
+    Запросы копятся по чатам, а воркеры берут чаты по приоритету их
+    первого запроса. Если лимит чата исчерпан, чат откладывается до
+    появления токенов и воркер сразу берется за другой чат, поэтому
+    очередь в канал не задерживает предпросмотры. Запросы в один чат
+    уходят по порядку. На TelegramRetryAfter чат приостанавливается на
+    retry_after секунд, и запрос повторяется. Альбом расходует по токену
+    на каждую картинку.
+
+    Если передан photo_cache, картинки send_photo и send_media_group по URL
+    отправляются по file_id из кэша, а file_id новых картинок берется из
+    ответа Telegram.
+    """
+
+    def __init__(self, bot: Bot, workers: int = 4, global_rate: float = GLOBAL_RATE,
+                 private_rate: float = PRIVATE_RATE, group_rate: float = GROUP_RATE,
+                 photo_cache: Optional[PhotoCache] = None):
+        self.bot = bot
+        self.photo_cache = photo_cache
+        self.workers = workers
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        # Запросы каждого чата: куча (приоритет, номер, метод, аргументы, future, попытка)
+        self._jobs: Dict[str, list] = {}
+        # Чаты, которые стоят в очереди, отложены или сейчас отправляются
+        self._active: Set[str] = set()
+        self._queue = None
+        self._tasks = []
+        self._counter = itertools.count()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chat_buckets.get(key)
+        if bucket is None:
+            # У групп и каналов отрицательные id
+            if key.startswith('-'):
+                bucket = TokenBucket(self.group_rate, GROUP_BURST)
+            else:
+                bucket = TokenBucket(self.private_rate, 1)
+            self._chat_buckets[key] = bucket
+        return bucket
+
+    @staticmethod
+    def _cost(method: str, kwargs: dict) -> int:
+        """Сколько сообщений Telegram засчитает запросу"""
+        if method == 'send_media_group':
+            return max(len(kwargs.get('media') or ()), 1)
+        return 1
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def send(self, method: str, priority: int = PRIORITY_CHANNEL, **kwargs):
+        """Ставит вызов метода бота (например, send_photo) в очередь и ждет результат"""
+        if not self._tasks:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        key = str(kwargs.get('chat_id'))
+        heapq.heappush(self._jobs.setdefault(key, []), (priority, next(self._counter), method, kwargs, future, 0))
+        if key not in self._active:
+            self._active.add(key)
+            self._schedule(key)
+        return await future
+
+    def _schedule(self, key: str):
+        """Ставит чат в очередь воркеров по его первому запросу"""
+        priority, seq = self._jobs[key][0][:2]
+        self._queue.put_nowait((priority, seq, key))
+
+    def _release(self, key: str, delay: float = 0):
+        """Возвращает чат в очередь (через delay секунд) или снимает, если запросов нет"""
+        if not self._jobs.get(key):
+            self._jobs.pop(key, None)
+            self._active.discard(key)
+        elif delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._schedule, key)
+        else:
+            self._schedule(key)
+
+    async def _worker(self):
+        while True:
+            _, _, key = await self._queue.get()
+            try:
+                await self._run_next(key)
+            finally:
+                self._queue.task_done()
+
+    async def _run_next(self, key: str):
+        jobs = self._jobs[key]
+        job = heapq.heappop(jobs)
+        priority, seq, method, kwargs, future, attempt = job
+        if future.cancelled():
+            self._release(key)
+            return
+
+        bucket = self._chat_bucket(key)
+        delay = bucket.reserve(self._cost(method, kwargs))
+        if delay:
+            # Чат ждет токенов, воркер тем временем берет другие чаты
+            heapq.heappush(jobs, job)
+            self._release(key, delay)
+            return
+
+        try:
+            result = await self._call(method, kwargs)
+        except TelegramRetryAfter as e:
+            if attempt < MAX_RETRIES:
+                logging.warning(f"Flood wait {e.retry_after} с для чата {key}, повтор {method}")
+                bucket.penalize(e.retry_after)
+                heapq.heappush(jobs, (priority, seq, method, kwargs, future, attempt + 1))
+                # Пауза уже в ведре чата: воркер отложит чат, пока она не пройдет
+                self._release(key)
+                return
+            if not future.cancelled():
+                future.set_exception(e)
+        except Exception as e:
+            if not future.cancelled():
+                future.set_exception(e)
+        else:
+            if not future.cancelled():
+                future.set_result(result)
+        self._release(key)
+
+    async def _call(self, method: str, kwargs: dict):
+        if method == 'send_media_group' and self.photo_cache is not None:
+            return await self._send_media_group(kwargs)
+
+        url = kwargs.get('photo') if method == 'send_photo' else None
+        if self.photo_cache is None or not isinstance(url, str) or not url.startswith('http'):
+            return await self._call_limited(method, kwargs)
+
+        file_id = self.photo_cache.get(url)
+        if file_id:
+            try:
+                return await self._call_limited(method, {**kwargs, 'photo': file_id})
+            except TelegramBadRequest as e:
+                # Ошибки подписи и разметки с file_id не связаны, кэш не трогаем
+                if not is_file_id_error(e):
+                    raise
+                # file_id стал недействительным, отправляем по URL заново
+                logging.warning(f"file_id для {url} не принят: {e}")
+                self.photo_cache.discard(url)
+
+        message = await self._call_limited(method, kwargs)
+        if getattr(message, 'photo', None):
+            # Последний размер - оригинальный
+            self.photo_cache.set(url, message.photo[-1].file_id)
+        return message
+
+    async def _send_media_group(self, kwargs: dict):
+        media = kwargs['media']
+        urls = [item.media if isinstance(item.media, str) and item.media.startswith('http') else None
+                for item in media]
+        file_ids = [self.photo_cache.get(url) if url else None for url in urls]
+        if any(file_ids):
+            cached = [item.model_copy(update={'media': file_id}) if file_id else item
+                      for item, file_id in zip(media, file_ids)]
+            try:
+                return await self._call_limited('send_media_group', {**kwargs, 'media': cached})
+            except TelegramBadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logging.warning(f"file_id в альбоме не приняты: {e}")
+                for url, file_id in zip(urls, file_ids):
+                    if file_id:
+                        self.photo_cache.discard(url)
+
+        messages = await self._call_limited('send_media_group', kwargs)
+        for url, message in zip(urls, messages or []):
+            if url and getattr(message, 'photo', None):
+                self.photo_cache.set(url, message.photo[-1].file_id)
+        return messages
+
+    async def _call_limited(self, method: str, kwargs: dict):
+        """Вызов метода бота в пределах общего лимита; лимит чата уже учтен воркером"""
+        await self._global.acquire(self._cost(method, kwargs))
+        return await getattr(self.bot, method)(**kwargs)
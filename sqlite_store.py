@@ -0,0 +1,41 @@
+import os
+import sqlite3
+import threading
+
+
+class SqliteStore:
+    """База SQLite в режиме WAL с одним ленивым подключением на все потоки
+
+    Подключение открывается при первом обращении к conn, схему создает
+    _setup() подкласса. Запросы к conn выполняются под self._lock.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+        return self._conn
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._setup(conn)
+        return conn
+
+    def _setup(self, conn: sqlite3.Connection):
+        """Создает таблицы и индексы в только что открытой базе"""
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
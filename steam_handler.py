@@ -1,18 +1,24 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.utils.markdown import hbold, hitalic
-from parsers.steam import SteamParser
-from typing import Dict, List
+from cache import TTLCache
+from parsers.steam import AsyncSteamParser
+from parsers.steam_catalog import SteamCatalog
+from typing import Dict, List, Optional
 
-steam_parser = SteamParser()
+# Сколько живут результаты поиска и сколько поисков помнить одновременно
+SEARCH_SESSION_TTL = 30 * 60
+MAX_SEARCH_SESSIONS = 100
+
+steam_parser = AsyncSteamParser(catalog=SteamCatalog())
 
 async def search_steam_games(query: str) -> List[Dict]:
     """Поиск игр в Steam по названию"""
-    return steam_parser.search_games(query)
+    return await steam_parser.search_games(query)
 
 async def get_steam_game_by_url(url: str) -> Dict:
     """Получение информации об игре по URL"""
-    return steam_parser.get_game_by_url(url)
+    return await steam_parser.get_game_by_url(url)
 
 def create_steam_search_keyboard(games: list, page: int = 0, items_per_page: int = 5) -> InlineKeyboardMarkup:
     """Создает клавиатуру с результатами поиска"""
@@ -58,6 +64,44 @@ def create_steam_search_keyboard(games: list, page: int = 0, items_per_page: int
     
     return builder.as_markup()
 
+class SearchSession:
+    """Результаты одного поиска и уже построенные страницы клавиатуры"""
+
+    __slots__ = ('games', '_pages')
+
+    def __init__(self, games: List[Dict]):
+        # Для клавиатуры нужны только id и название
+        self.games = [{'id': game['id'], 'name': game['name']} for game in games]
+        self._pages = {}
+
+    def keyboard(self, page: int = 0) -> InlineKeyboardMarkup:
+        markup = self._pages.get(page)
+        if markup is None:
+            markup = self._pages[page] = create_steam_search_keyboard(self.games, page)
+        return markup
+
+class SearchSessions:
+    """Сессии поиска по (chat_id, message_id) сообщения с результатами
+
+    Старые сессии вытесняются по времени жизни и по числу, поэтому память
+    не растет, а поиски разных админов не перетирают друг друга.
+    """
+
+    def __init__(self, maxsize: int = MAX_SEARCH_SESSIONS, ttl: float = SEARCH_SESSION_TTL):
+        self._sessions = TTLCache(maxsize, ttl)
+
+    def add(self, chat_id: int, message_id: int, session: SearchSession):
+        self._sessions.set((chat_id, message_id), session)
+
+    def get(self, chat_id: int, message_id: int) -> Optional[SearchSession]:
+        return self._sessions.get((chat_id, message_id))
+
+    def close(self, chat_id: int, message_id: int):
+        self._sessions.pop((chat_id, message_id))
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
 def format_steam_post(game_info: Dict) -> str:
     """Форматирует пост для игры из Steam"""
     if game_info['is_free']:
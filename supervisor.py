@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Hashable, List, Union
+
+RETRY_BASE = 30
+RETRY_MAX = 1800
+JITTER = 0.1
+
+
+class SupervisedTask:
+    """Проверка, которая сама себя перезапускает
+
+    У каждой проверки свой интервал (число секунд или функция, возвращающая
+    паузу), свой таймаут и своя экспоненциальная пауза после ошибок со
+    случайным разбросом. Ошибка одной проверки не задерживает остальные.
+    Запуски одной проверки идут строго друг за другом.
+    """
+
+    def __init__(self, name: str, check: Callable[[], Awaitable], interval: Union[float, Callable[[], float]],
+                 timeout: float, retry_base: float = RETRY_BASE, retry_max: float = RETRY_MAX,
+                 jitter: float = JITTER):
+        self.name = name
+        self.check = check
+        self.interval = interval
+        self.timeout = timeout
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.jitter = jitter
+        self.failures = 0
+
+    def _next_interval(self) -> float:
+        return self.interval() if callable(self.interval) else self.interval
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def run_once(self):
+        """Выполняет проверку; по таймауту она отменяется
+
+        Шаги, которые нельзя прерывать (отправка поста и запись в историю),
+        проверка защищает сама через asyncio.shield.
+        """
+        await asyncio.wait_for(self.check(), timeout=self.timeout)
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+                self.failures = 0
+                delay = self._next_interval()
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                self.failures += 1
+                delay = min(self.retry_base * 2 ** (self.failures - 1), self.retry_max)
+                logging.error(f"Проверка {self.name} не уложилась в {self.timeout} с, повтор через {int(delay)} с")
+            except Exception as e:
+                self.failures += 1
+                delay = min(self.retry_base * 2 ** (self.failures - 1), self.retry_max)
+                logging.error(f"Ошибка в проверке {self.name}: {e}, повтор через {int(delay)} с")
+            await asyncio.sleep(self._jittered(delay))
+
+
+class Supervisor:
+    """Запускает проверки независимыми задачами и останавливает их вместе"""
+
+    def __init__(self):
+        self.tasks: List[SupervisedTask] = []
+        self._running: List[asyncio.Task] = []
+
+    def add(self, task: SupervisedTask) -> SupervisedTask:
+        self.tasks.append(task)
+        return task
+
+    def start(self):
+        self._running = [
+            asyncio.create_task(task.run_forever(), name=f"check:{task.name}") for task in self.tasks
+        ]
+
+    async def stop(self):
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        self._running = []
+
+
+class KeyedLocks:
+    """Блокировки по ключу (игре), общие для проверок и таймеров раздач
+
+    Пока одна задача меняет пост и запись истории игры, другие задачи с
+    той же игрой ждут. Неиспользуемые блокировки удаляются.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)